@@ -0,0 +1,103 @@
+# Per-event cost of going through ctypes for the CAEN_DGTZ_GetEventInfo +
+# CAEN_DGTZ_DecodeEvent pair, the two calls made for every event read.
+# No board (nor libCAENDigitizer) needed: every CAEN_DGTZ_* call is bound to
+# libc's labs(), which does next to nothing, so what is left is the cost of
+# the Python side of each call.
+#
+# - before:     old Digitizer code, attribute lookup on the library, no
+#               argtypes, new c_uint32/byref objects at every call
+# - declared:   same, through the prototypes in digitizer.PROTOTYPES with
+#               argument objects reused: argtypes checks are not free
+# - after:      bound calls without argtypes (digitizer.unchecked), argument
+#               objects reused, what Digitizer does now
+# - getEvent:   Digitizer.getEvent() in a loop
+# - events:     Digitizer.events(), the batch helper used by decodeBlock()
+#
+# Usage: python benchmarks/calls.py [events] [repeats]
+
+from ctypes import *
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from modules import digitizer
+
+EVENTS = 100000
+REPEATS = 5
+
+# Library stand-in, every function is a separate labs() function object so
+# that each can have its own prototype
+class StandIn():
+
+    def __init__(self):
+        self.libc = CDLL(None)
+
+    def __getattr__(self, name):
+        function = self.libc._FuncPtr(("labs", self.libc))
+        function.restype = c_long
+        setattr(self, name, function)
+        return function
+
+def before(api, dgt, buffer, events):
+    for i in range(events):
+        api.CAEN_DGTZ_GetEventInfo(dgt.handle, buffer.data, buffer.size,
+            c_uint32(i), byref(dgt.eventInfo), byref(dgt.eventPointer))
+        api.CAEN_DGTZ_DecodeEvent(dgt.handle, dgt.eventPointer,
+            dgt.eventVoidPointer)
+
+def declared(api, dgt, buffer, events):
+    reuse(api.CAEN_DGTZ_GetEventInfo, api.CAEN_DGTZ_DecodeEvent, dgt, buffer,
+        events)
+
+def after(api, dgt, buffer, events):
+    reuse(dgt.getEventInfoCall, dgt.decodeEventCall, dgt, buffer, events)
+
+# Argument objects made once, as Digitizer.events() does
+def reuse(getEventInfo, decodeEvent, dgt, buffer, events):
+    handle, data, size = dgt.handle, buffer.data, buffer.size
+    index, infoRef, pointerRef = dgt.eventIndex, dgt.eventInfoRef, \
+        dgt.eventPointerRef
+    for i in range(events):
+        index.value = i
+        getEventInfo(handle, data, size, index, infoRef, pointerRef)
+        decodeEvent(handle, dgt.eventPointer, dgt.eventVoidPointer)
+
+def getEvent(api, dgt, buffer, events):
+    for i in range(events):
+        dgt.getEvent(i, buffer = buffer)
+
+def batch(api, dgt, buffer, events):
+    for i, info, event in dgt.events(buffer, size = events):
+        pass
+
+def best(run, api, dgt, events, repeats):
+    times = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        run(api, dgt, dgt.readout, events)
+        times.append(time.perf_counter() - start)
+    return min(times) / events
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else REPEATS
+
+    plain = StandIn()
+    api = StandIn()
+    digitizer.register(api)
+
+    digitizer.API = api
+    dgt = digitizer.Digitizer(0)
+    # labs() decodes nothing, give the digitizer an event to point to
+    decoded = digitizer.Event()
+    dgt.eventObject.contents = decoded
+
+    print("\nPer-event GetEventInfo + DecodeEvent overhead, {} events, "
+        "best of {}".format(count, repeats))
+    reference = None
+    for name, run, library in [("before", before, plain),
+        ("declared", declared, api), ("after", after, api),
+        ("getEvent", getEvent, api), ("events", batch, api)]:
+        t = best(run, library, dgt, count, repeats)
+        reference = reference or t
+        print("    {:10s} {:7.0f} ns/event  x{:.2f}".format(name, t * 1E9,
+            reference / t))
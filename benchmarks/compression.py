@@ -0,0 +1,141 @@
+# Write speed and compression ratio of each output format (ROOT, HDF5) for
+# each compression algorithm and level, sample type and basket size. Waveforms come from the
+# simulated digitizer (LGAD pulses on a noisy baseline plus the TR0 copies),
+# decoded once up front so only filling and writing get timed.
+#
+# Reports MB/s of samples going in (as stored, e.g. 2 bytes each for SHORT),
+# MB/s hitting the disk and the compression ratio between the two. Results
+# are saved as JSON, like benchmarks/throughput.py does.
+#
+# Usage: python benchmarks/compression.py --help
+
+import sys, os, time, json, platform, tempfile, argparse, datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from modules import digitizer
+from modules.io import writer
+
+EVENTS = 2000
+LENGTH = 1024
+SETTINGS = ["NONE", "ZLIB:1", "ZLIB:6", "LZMA:1", "LZ4:1", "LZ4:4", "ZSTD:1",
+    "ZSTD:5"]
+SAMPLE_TYPES = ["FLOAT", "SHORT"]
+BASKET_SIZES = [0, 256000]
+FORMATS = ["ROOT"]
+# Events per point, the file is written after each point
+POINT_EVENTS = 1000
+
+# Decoded blocks from the simulated board, as consume() gets them
+def makeBlocks(events, length, occupancy):
+    digitizer.load("SIMULATED", {"rate": 1E6, "occupancy": occupancy,
+        "seed": 0})
+    dgt = digitizer.Digitizer(0)
+    dgt.setRecordLength(length)
+    dgt.setMaxNumEventsBLT(1023)
+    dgt.setFastTriggerDigitizing(1)
+    dgt.setPostTriggerSize(50)
+    dgt.allocateEvent()
+    dgt.mallocBuffer()
+
+    blocks, taken = [], 0
+    dgt.startAcquisition()
+    while taken < events:
+        dgt.readData()
+        samples, info, groups = dgt.decodeBlock(None, events - taken)
+        blocks.append((samples.copy(), groups["GrPresent"].copy()))
+        taken += len(samples)
+
+    dgt.stopAcquisition()
+    dgt.freeEvent()
+    dgt.freeBuffer()
+    dgt.close()
+    return blocks
+
+# "ALGORITHM:LEVEL" to (algorithm, level)
+def parseSetting(setting):
+    algorithm, _, level = setting.partition(":")
+    return algorithm, int(level or 0)
+
+def run(blocks, format, setting, sampleType, basketSize):
+    algorithm, level = parseSetting(setting)
+    compression = writer.compressionSetting(algorithm, level)
+    path = tempfile.mkdtemp()
+    file = writer.create(format, path, "bench", compression = compression,
+        sampleType = sampleType, basketSize = basketSize)
+
+    itemSize = np.dtype(writer.SAMPLE_TYPES[sampleType][1]).itemsize
+    events, payload = 0, 0
+    start = time.perf_counter()
+    for samples, present in blocks:
+        file.fillBlock(samples, present)
+        events += len(samples)
+        payload += samples[:, writer.BRANCH_ROWS].size * itemSize
+        if events % POINT_EVENTS < len(samples):
+            file.write()
+    file.close()
+    elapsed = time.perf_counter() - start
+
+    output = os.path.join(path, "bench." + writer.FORMATS[format][2])
+    written = os.path.getsize(output)
+    os.remove(output)
+    return {
+        "format": format,
+        "algorithm": algorithm,
+        "level": level,
+        "compression": compression,
+        "sampleType": sampleType,
+        "basketSize": basketSize,
+        "events": events,
+        "elapsed": elapsed,
+        "eventsPerSecond": events / elapsed,
+        "inputMBps": payload / elapsed / 1E6,
+        "outputMBps": written / elapsed / 1E6,
+        "compressionRatio": payload / max(written, 1)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Output compression")
+    parser.add_argument("--events", type = int, default = EVENTS)
+    parser.add_argument("--length", type = int, default = LENGTH)
+    parser.add_argument("--occupancy", type = float, default = 0.25,
+        help = "fraction of channels with a pulse")
+    parser.add_argument("--settings", nargs = "+", default = SETTINGS,
+        help = "ALGORITHM:LEVEL, see io.writer.ALGORITHMS")
+    parser.add_argument("--types", nargs = "+", default = SAMPLE_TYPES,
+        choices = list(writer.SAMPLE_TYPES))
+    parser.add_argument("--formats", nargs = "+", default = FORMATS,
+        choices = ["ROOT", "HDF5"])
+    parser.add_argument("--baskets", type = int, nargs = "+",
+        default = BASKET_SIZES, help = "basket sizes in bytes, 0 for ROOT's")
+    parser.add_argument("--output", default = "compression.json")
+    args = parser.parse_args()
+
+    blocks = makeBlocks(args.events, args.length, args.occupancy)
+
+    results = []
+    print("\n{:5s} {:8s} {:6s} {:>7s} {:>10s} {:>9s} {:>9s} {:>6s}".format(
+        "file", "setting", "type", "basket", "events/s", "MB/s in",
+        "MB/s out", "ratio"))
+    for format in args.formats:
+        for setting in args.settings:
+            for sampleType in args.types:
+                for basketSize in args.baskets:
+                    result = run(blocks, format, setting, sampleType,
+                        basketSize)
+                    results.append(result)
+                    print("{:5s} {:8s} {:6s} {:7d} {:10.0f} {:9.1f} {:9.1f} "
+                        "{:6.2f}".format(format, setting, sampleType,
+                        basketSize, result["eventsPerSecond"],
+                        result["inputMBps"], result["outputMBps"],
+                        result["compressionRatio"]))
+
+    with open(args.output, "w") as output:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "recordLength": args.length,
+            "occupancy": args.occupancy,
+            "results": results}, output, indent = 2)
+    print("\nResults saved to {}".format(args.output))
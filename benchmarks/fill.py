@@ -0,0 +1,59 @@
+# Compare the old per-sample push_back loop against the bulk NumPy fill used
+# by TreeFile.setChannel/setTrigger. Samples come from ctypes float buffers
+# laid out like the Group structures filled by decodeEvent().
+#
+# Usage: python benchmarks/fill.py [events] [record length]
+
+from ctypes import *
+import sys, os, time, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from modules.io import tree
+
+EVENTS = 200
+LENGTH = 1024
+
+# Old TreeFile behaviour, one Python call per sample
+def legacyFill(vector, data, length):
+    vector.clear()
+    for w in range(length):
+        vector.push_back(float(data[w]))
+
+def makeGroups(length):
+    # Keep the buffers alive, hand out pointers like DataChannel[n] does
+    buffers = [(c_float*length)(*[float(i % 4096) for i in range(length)])
+        for j in range(18)]
+    pointers = [cast(b, POINTER(c_float)) for b in buffers]
+    return buffers, pointers
+
+def run(name, fill, events, length):
+    path = tempfile.mkdtemp()
+    file = tree.TreeFile(path, name)
+    buffers, pointers = makeGroups(length)
+
+    start = time.perf_counter()
+    for i in range(events):
+        for j in range(18):
+            group = int(j / 9)
+            channel = j - (9 * group)
+            if channel == 8:
+                fill(file.triggers[group], pointers[j], length)
+            else:
+                fill(file.channels[j - group], pointers[j], length)
+        file.fill()
+    elapsed = time.perf_counter() - start
+
+    file.close()
+    return events / elapsed
+
+if __name__ == "__main__":
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else LENGTH
+
+    legacy = run("legacy", legacyFill, events, length)
+    bulk = run("bulk", tree.fillVector, events, length)
+
+    print("\n\nRecord length {}, {} events".format(length, events))
+    print("push_back loop: {:10.1f} events/s".format(legacy))
+    print("NumPy bulk:     {:10.1f} events/s".format(bulk))
+    print("Speedup:        {:10.1f}x".format(bulk / legacy))
@@ -0,0 +1,42 @@
+# Stage travel and move time of scan.py orderings against the plain ones:
+# GRID column by column vs serpentine, random LIST points as listed vs
+# nearest neighbour + 2-opt. Also times the planner itself.
+#
+# Usage: python benchmarks/scanpath.py [grid size] [list points] [speed]
+
+import sys, os, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from modules import scan
+
+GRID = 100
+LIST = 500
+SPEED = 1500 # steps/min
+STEP = 10 # um
+AREA = 5000 # um
+
+def report(name, before, after, elapsed, speed):
+    b = scan.travel(before, (0, 0), speed)
+    a = scan.travel(after, (0, 0), speed)
+    print("    {:6s} {:8.1f} -> {:8.1f} mm {:8.1f} -> {:8.1f} min  "
+        "planned in {:.2f} s".format(name, b[0] / 1E3, a[0] / 1E3,
+        b[1] / 60, a[1] / 60, elapsed))
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else GRID
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else LIST
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else SPEED
+
+    print("\nStage travel and move time, before -> after")
+    axis = range(0, size * STEP, STEP)
+    grid = [(x, y) for x in axis for y in axis]
+    start = time.perf_counter()
+    planned = scan.serpentine(axis, axis)
+    report("GRID", grid, planned, time.perf_counter() - start, speed)
+
+    points = [tuple(p) for p in
+        np.random.default_rng(0).uniform(0, AREA, (count, 2)).tolist()]
+    start = time.perf_counter()
+    planned = scan.order(points, (0, 0), speed)
+    report("LIST", points, planned, time.perf_counter() - start, speed)
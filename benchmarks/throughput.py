@@ -0,0 +1,237 @@
+# End-to-end throughput of acquisition: main.py itself, run on the
+# simulated digitizer with a temporary config, so that everything a real run
+# goes through counts (readout engine, tracker, channel selection, ROI,
+# features, writer process, journal). Hardware other than the digitizer is
+# left to manual mode and prompts are answered automatically.
+#
+# Reports sustained events/s and MB/s, plus the time spent in each stage,
+# for every combination of record length, group mask, compression and
+# sample type. Results are saved as JSON so runs can be compared over time.
+# readData includes the time it takes the simulator to make events up, and
+# stages on different threads add up. With --writer-process, fillBlock and
+# write are what the DAQ waits for: handing blocks over, and the file being
+# on disk.
+#
+# Usage: python benchmarks/throughput.py --help
+
+import sys, os, time, json, platform, tempfile, argparse, datetime, runpy
+import builtins, configparser, contextlib, importlib
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+from modules import digitizer, io
+
+RECORD_LENGTHS = [1024, 520, 256, 136]
+GROUP_MASKS = [0b01, 0b10, 0b11]
+# COMPRESSION:COMPRESSION_LEVEL
+COMPRESSIONS = ["NONE:0", "ZLIB:1", "LZ4:4", "ZSTD:5"]
+SAMPLE_TYPES = ["FLOAT"]
+
+EVENTS = 5000
+# Simulated trigger rate, high enough for the board to always have data
+RATE = 1E6
+# Events per point, the file is written after each point
+POINT_EVENTS = 1000
+
+# Stage: methods timed as (module, class, method), on whichever of them the
+# run goes through. Modules that can't be imported (no ROOT, no h5py) are
+# left out.
+STAGES = {
+    "readData": [("modules.digitizer", "Digitizer", "readData")],
+    "decode": [("modules.digitizer", "Digitizer", "decodeBlock")],
+    "features": [("modules.features", "Reducer", "reduce")],
+    "select": [("modules.features", "Selector", "select")],
+    "window": [("modules.features", "Window", "apply")],
+    "fillBlock": [("modules.io.process", "WriterProcess", "fillBlock"),
+        ("modules.io.tree", "TreeFile", "fillBlock"),
+        ("modules.io.hdf5", "Hdf5File", "fillBlock"),
+        ("modules.io.raw", "RawFile", "writeBlock")],
+    "write": [("modules.io.process", "WriterProcess", "write"),
+        ("modules.io.tree", "TreeFile", "write"),
+        ("modules.io.hdf5", "Hdf5File", "write"),
+        ("modules.io.raw", "RawFile", "write")]}
+
+class Timer():
+
+    def __init__(self):
+        self.stages = {stage: 0.0 for stage in STAGES}
+        self.transferred = 0
+        # From the start of the first point to the last one on disk
+        self.first = None
+        self.last = None
+        self.originals = []
+
+    # Time every method of STAGES, plus what is needed for the totals
+    def install(self):
+        for stage, methods in STAGES.items():
+            for module, cls, name in methods:
+                try:
+                    cls = getattr(importlib.import_module(module), cls)
+                except ImportError:
+                    continue
+                self.patch(cls, name, self.wrap(stage, getattr(cls, name)))
+
+        readData = digitizer.Digitizer.readData
+        def counted(dgt, buffer = None):
+            result = readData(dgt, buffer)
+            self.transferred += (buffer or dgt.readout).size.value
+            return result
+        self.patch(digitizer.Digitizer, "readData", counted)
+
+        startAcquisition = digitizer.Digitizer.startAcquisition
+        def started(dgt):
+            if self.first == None:
+                self.first = time.perf_counter()
+            return startAcquisition(dgt)
+        self.patch(digitizer.Digitizer, "startAcquisition", started)
+
+    def uninstall(self):
+        for cls, name, method in reversed(self.originals):
+            setattr(cls, name, method)
+        self.originals = []
+
+    def patch(self, cls, name, method):
+        self.originals.append((cls, name, getattr(cls, name)))
+        setattr(cls, name, method)
+
+    # Wrap _function_ so that the time spent in it adds up in _stage_
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            end = time.perf_counter()
+            self.stages[stage] += end - start
+            if stage == "write":
+                self.last = end
+            return result
+        return timed
+
+# config.ini with the benchmark _settings_ on top, written to _path_
+def writeConfig(path, settings):
+    config = configparser.ConfigParser()
+    config.optionxform = lambda option: option
+    config.read(os.path.join(ROOT_DIR, "config.ini"))
+    for section, values in settings.items():
+        for key, value in values.items():
+            config[section][key] = str(value)
+
+    file = os.path.join(path, "bench.ini")
+    with open(file, "w") as output:
+        config.write(output)
+    return file
+
+def yesNo(flag):
+    return "YES" if flag else "NO"
+
+def run(length, mask, compression, sampleType, format, events, threaded,
+    writerProcess, withFeatures, arrays):
+    path = tempfile.mkdtemp()
+    points = max(events // POINT_EVENTS, 1)
+    algorithm, level = compression.split(":")
+    groups = [g for g in range(digitizer.GROUPS) if mask & 1 << g]
+    configPath = writeConfig(path, {
+        "ACQUISITION": {"MAX_EVENTS": POINT_EVENTS, "MODE": "LIST",
+            "X_LIST": list(range(points)), "Y_LIST": [0] * points,
+            "OPTIMIZE_PATH": "NO", "DATA_PATH": path, "FILENAME": "bench",
+            "OUTPUT": format, "SHARD_POINTS": 0, "SAMPLE_TYPE": sampleType,
+            "BRANCH_LAYOUT": "ARRAY" if arrays else "VECTOR",
+            "COMPRESSION": algorithm, "COMPRESSION_LEVEL": level,
+            "FEATURES": yesNo(withFeatures)},
+        "DIGITIZER": {"BACKEND": "SIMULATED", "SIMULATED_RATE": int(RATE),
+            "EVENT_LENGTH": length,
+            "CHANNELS": [g * 8 + c for g in groups for c in range(8)],
+            "TRIGGERS": groups, "THREADED_READOUT": yesNo(threaded),
+            "WAIT_MODE": "POLL", "WRITER_PROCESS": yesNo(writerProcess)},
+        "HIGHVOLTAGE": {"MANUAL": "YES", "SENSOR_BIAS": [100]},
+        "STAGE": {"MANUAL": "YES"}})
+
+    timer = Timer()
+    timer.install()
+    answer = builtins.input
+    builtins.input = lambda prompt = "": ""
+    argv = sys.argv
+    sys.argv = ["main.py", configPath]
+    try:
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            runpy.run_path(os.path.join(ROOT_DIR, "main.py"),
+                run_name = "__main__")
+    finally:
+        sys.argv = argv
+        builtins.input = answer
+        timer.uninstall()
+
+    elapsed = timer.last - timer.first
+    taken = points * POINT_EVENTS
+    written = sum(os.path.getsize(os.path.join(path, file))
+        for file in os.listdir(path) if file.startswith("bench.")
+        and not file.endswith((".ini", ".journal")))
+    return {
+        "recordLength": length,
+        "groupMask": mask,
+        "compression": compression,
+        "sampleType": sampleType,
+        "format": format,
+        "threaded": threaded,
+        "writerProcess": writerProcess,
+        "features": withFeatures,
+        "arrays": arrays,
+        "events": taken,
+        "elapsed": elapsed,
+        "eventsPerSecond": taken / elapsed,
+        "inputMBps": timer.transferred / elapsed / 1E6,
+        "outputMBps": written / elapsed / 1E6,
+        "compressionRatio": timer.transferred / max(written, 1),
+        "stages": {stage: {"seconds": t, "eventsPerSecond":
+            taken / t if t > 0 else None}
+            for stage, t in timer.stages.items()}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Acquisition throughput")
+    parser.add_argument("--events", type = int, default = EVENTS)
+    parser.add_argument("--lengths", type = int, nargs = "+",
+        default = RECORD_LENGTHS)
+    parser.add_argument("--masks", type = int, nargs = "+",
+        default = GROUP_MASKS)
+    parser.add_argument("--compressions", nargs = "+",
+        default = COMPRESSIONS, help = "COMPRESSION:COMPRESSION_LEVEL")
+    parser.add_argument("--types", nargs = "+", default = SAMPLE_TYPES,
+        choices = list(io.writer.SAMPLE_TYPES))
+    parser.add_argument("--format", default = "ROOT",
+        choices = list(io.writer.FORMATS))
+    parser.add_argument("--threaded", action = "store_true",
+        help = "go through the threaded readout engine")
+    parser.add_argument("--writer-process", action = "store_true",
+        help = "write from a separate process")
+    parser.add_argument("--features", action = "store_true",
+        help = "compute and store waveform features")
+    parser.add_argument("--arrays", action = "store_true",
+        help = "fixed-size array branches instead of std::vector")
+    parser.add_argument("--output", default = "throughput.json")
+    args = parser.parse_args()
+
+    results = []
+    for length in args.lengths:
+        for mask in args.masks:
+            for compression in args.compressions:
+                for sampleType in args.types:
+                    result = run(length, mask, compression, sampleType,
+                        args.format, args.events, args.threaded,
+                        args.writer_process, args.features, args.arrays)
+                    results.append(result)
+                    print("\nlength {:4d} mask {} compression {:7s} {:6s}: "
+                        "{:8.0f} events/s, {:6.1f} MB/s in, {:6.1f} MB/s out"
+                        .format(length, mask, compression, sampleType,
+                        result["eventsPerSecond"], result["inputMBps"],
+                        result["outputMBps"]))
+                    for stage in STAGES:
+                        print("    {:10s} {:8.3f} s".format(stage,
+                            result["stages"][stage]["seconds"]))
+
+    with open(args.output, "w") as output:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "results": results}, output, indent = 2)
+    print("\nResults saved to {}".format(args.output))
@@ -0,0 +1,152 @@
+from modules import x742, readout, features, io
+import sys, os, mmap, time
+import multiprocessing as mp
+
+# Convert a .raw dump (OUTPUT = RAW) to ROOT or HDF5, features included
+# (with default Reducer settings). Points are shared out between all cores
+# and each worker decodes, reduces and writes its own shard, only a summary
+# of it comes back. Shards are listed in a manifest ({name}.json) as with
+# SHARD_POINTS, see io.shards, which io.reader.read() opens as one file.
+#
+# Usage: python convert.py input.raw [output directory] [workers] [type]
+#     [format] [--uncorrected]
+#
+# _type_ is the SAMPLE_TYPE to store waveforms as, FLOAT by default, and
+# _format_ the OUTPUT, ROOT (default) or HDF5.
+#
+# Decoding happens without libCAENDigitizer, so the DRS4 corrections enabled
+# by USE_INTERNAL_CORRECTION can't be applied: samples are raw ADC counts
+# straight from the board, which SHORT holds with no loss. Dumps taken with
+# corrections on are refused, unless --uncorrected says that's fine.
+
+def convert(path, outputPath, workers, sampleType = "FLOAT", format = "ROOT",
+    uncorrected = False):
+    (frequency, length, flags), frames = io.raw.scan(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    if flags == None:
+        print("\nWARNING: {} doesn't say whether the board applied its DRS4 "
+            "corrections, the output won't have them".format(path))
+    elif flags & io.raw.FLAG_CORRECTED:
+        if not uncorrected:
+            print("\n{} was taken with USE_INTERNAL_CORRECTION = YES, these "
+                "corrections can't be applied offline. Use --uncorrected to "
+                "convert to uncorrected ADC counts anyway.".format(path))
+            return False
+        print("\nWARNING: {} was taken with USE_INTERNAL_CORRECTION = YES, "
+            "the output is NOT corrected".format(path))
+
+    manifestPath = os.path.join(outputPath, "{}.json".format(name))
+    if os.path.exists(manifestPath):
+        raise FileExistsError(manifestPath)
+
+    # Frames of each point, in the order they were taken
+    points = {}
+    for frame in frames:
+        points.setdefault(frame[7], []).append(frame)
+    shards = split(list(points.values()), workers)
+
+    print("\nConverting {} frames ({} points) from {} into {} shards with {} "
+        "workers... ".format(len(frames), len(points), path, len(shards),
+        workers))
+
+    manifest = {"name": name, "format": format, "frequency": frequency,
+        "length": length, "shardPoints": 0, "shards": []}
+    options = {"sampleType": sampleType, "features": True, "lengths": length}
+    start = time.time()
+    with mp.Pool(workers, openInput, (path, outputPath, name, format,
+        options, frequency, length)) as pool:
+        # Summaries come back in order, one shard at a time
+        for shard in pool.imap(convertShard, enumerate(shards)):
+            manifest["shards"].append(shard)
+            io.shards.writeManifest(manifestPath, manifest)
+    io.shards.writeManifest(manifestPath, manifest)
+
+    events = sum(shard["events"] for shard in manifest["shards"])
+    elapsed = time.time() - start
+    print("Done! {} events in {:.1f} s ({:.0f} events/s)".format(events,
+        elapsed, events / max(elapsed, 1E-9)))
+    return True
+
+# Share _points_ (lists of frames) out between at most _count_ shards of
+# consecutive points, about the same number of bytes each
+def split(points, count):
+    sizes = [sum(frame[5] for frame in point) for point in points]
+    total = sum(sizes)
+    shards, shard, size = [], [], 0
+    for point, bytes in zip(points, sizes):
+        shard.append(point)
+        size += bytes
+        if size >= total * (len(shards) + 1) / count:
+            shards.append(shard)
+            shard = []
+    if len(shard) > 0:
+        shards.append(shard)
+    return shards
+
+# Each worker maps the input file once and writes shards next to the
+# manifest
+def openInput(path, outputPath, name, format, options, frequency, length):
+    global mapping, reducer, job
+    file = open(path, "rb")
+    mapping = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+    reducer = features.Reducer(frequency)
+    job = {"path": outputPath, "name": name, "format": format,
+        "options": options, "frequency": frequency, "length": length}
+
+# Write the points of shard _index_ to a file of their own, closing each
+# point as the DAQ does. Returns the manifest entry of the shard.
+def convertShard(task):
+    index, points = task
+    name = "{}_{:04d}".format(job["name"], index)
+    file = io.writer.create(job["format"], job["path"], name,
+        **job["options"])
+    file.setFrequency(job["frequency"])
+    file.setEventLength(job["length"])
+
+    shard = {"file": "{}.{}".format(name,
+        io.writer.FORMATS[job["format"]][2]), "events": 0, "bytes": 0,
+        "opened": time.time(), "closed": 0, "points": []}
+    tracker = readout.Tracker()
+    for frames in points:
+        offset, bias, x, y, t = frames[0][:5]
+        file.setBias(bias)
+        file.setPosition(x, y)
+        tracker.reset(t)
+
+        events = 0
+        for offset, bias, x, y, t, size, n, point in frames:
+            samples, info, groups = x742.decode(mapping[offset:offset + size])
+            present = groups["GrPresent"]
+            tracker.update(info, t)
+            file.fillBlock(samples, present)
+            file.fillFeatures(reducer.reduce(samples, present))
+            events += len(samples)
+
+        file.fillPoint(tracker.stats())
+        shard["points"].append({"bias": bias, "x": x, "y": y,
+            "events": events})
+        shard["events"] += events
+
+    file.close()
+    shard["bytes"] = os.path.getsize(os.path.join(job["path"], shard["file"]))
+    shard["closed"] = time.time()
+    return shard
+
+if __name__ == "__main__":
+    uncorrected = "--uncorrected" in sys.argv
+    args = [arg for arg in sys.argv if arg != "--uncorrected"]
+    if len(args) < 2:
+        print("Usage: python convert.py input.raw [output directory] "
+            "[workers] [type] [format] [--uncorrected]")
+        exit()
+
+    path = args[1]
+    outputPath = args[2] if len(args) > 2 else os.path.dirname(path)
+    workers = int(args[3]) if len(args) > 3 else os.cpu_count()
+    sampleType = args[4] if len(args) > 4 else "FLOAT"
+    format = args[5] if len(args) > 5 else "ROOT"
+
+    if not convert(path, outputPath, workers, sampleType, format,
+        uncorrected):
+        exit(1)
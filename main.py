@@ -1,15 +1,20 @@
 from modules import *
-import sys, os, datetime, time
+import sys, os, datetime, time, functools
 
 CONFIG_PATH = "config.ini"
 
 DIGITIZER_MODELS = ["DT5742"]
 HIGHVOLTAGE_MODELS = ["DT1471ET", "DT1470ET"]
+# Times a move is sent again when the stage doesn't get to a point in time
+MOVE_RETRIES = 1
 
 class UFSDPyDAQ:
 
-    def __init__(self, config):
+    # With _resume_ points already in the journal of a previous run are
+    # skipped, see io.journal
+    def __init__(self, config, resume = False):
         self.config = config
+        self.resume = resume
 
         # PyUSB acts weird if we try to connect the digitizer first...
         self.connectHighVoltage()
@@ -29,14 +34,68 @@ class UFSDPyDAQ:
         self.dgt.allocateEvent()
         self.dgt.mallocBuffer()
 
+        self.waiter = readout.Waiter(self.dgt, self.config.waitMode)
+        self.tracker = readout.Tracker()
+        self.reducer = None
+        if self.config.isFeatureEnabled() and \
+            self.config.outputFormat != "RAW":
+            self.reducer = features.Reducer(self.config.frequencyValue,
+                **self.config.featureOptions)
+        options = self.config.featureOptions
+        self.selector = features.Selector(self.config.keptChannels,
+            self.config.keptTriggers, self.config.suppressionThreshold,
+            options.get("baselineSamples", features.BASELINE_SAMPLES),
+            options.get("polarity", features.POLARITY))
+        self.merit = None
+        if self.config.mode == 4:
+            self.merit = scan.Merit(self.selector.rows &
+                ~self.selector.triggerRows)
+        self.window = None
+        if self.config.roiOptions != None:
+            self.window = features.Window(**self.config.roiOptions)
+        self.readout = None
+        if self.config.isReadoutThreaded():
+            self.readout = readout.Readout(self.dgt, self.consume,
+                self.config.readoutBuffers, self.waiter)
+
     def prepare(self):
         dir = self.config.outputPath
         if not os.path.exists(dir):
             os.mkdir(dir)
-        self.file = io.tree.TreeFile(dir, self.config.outputFile)
+        self.journal = io.journal.Journal(dir, self.config.outputFile,
+            self.resume)
+        name = self.journal.startPart()
+        compression = io.writer.compressionSetting(
+            self.config.compressionAlgorithm, self.config.compressionLevel)
+        options = {"compression": compression,
+            "sampleType": self.config.sampleType,
+            "features": self.config.isFeatureEnabled(),
+            "basketSize": self.config.basketSize,
+            "autoFlush": self.config.autoFlush,
+            "autoSave": self.config.autoSave,
+            "lengths": self.branchLengths()}
+        if self.config.shardPoints > 0:
+            opener = functools.partial(io.shards.ShardedFile, dir, name,
+                self.config.shardPoints, self.config.outputFormat, **options)
+        else:
+            opener = functools.partial(io.writer.create,
+                self.config.outputFormat, dir, name, **options)
+        if self.config.isWriterProcess() and \
+            self.config.outputFormat != "RAW":
+            self.file = io.process.WriterProcess(opener,
+                self.config.eventSize, self.config.writerSlots,
+                self.config.writerSlotEvents)
+        else:
+            self.file = opener()
+        if self.config.outputFormat != "RAW":
+            self.file.setScale(self.config.sampleScales,
+                self.config.sampleOffsets)
+        else:
+            self.file.setCorrection(self.config.isCorrectionEnabled())
 
         self.file.setFrequency(self.config.frequencyValue)
         self.file.setEventLength(self.config.eventSize)
+        self.file.setSettings(self.config.asDict())
 
         self.hv.enableChannel(self.config.powerChannels)
         self.hvSetBlocking(self.config.triggerChannel,
@@ -48,11 +107,25 @@ class UFSDPyDAQ:
             return True
 
     def acquire(self):
-        (xStart, xStep, xStop,
-            yStart, yStep, yStop) = self.config.getGrid(inclusive = True)
+        # Points of MODE = ADAPTIVE depend on what is seen along the way
+        adaptive = self.config.mode == 4
+        points = [] if adaptive else self.scanPoints()
+        if self.config.isPathOptimized():
+            points = self.planPoints(points)
 
         for bias in self.config.sensorBiases:
+            remaining = [(x, y) for x, y in points
+                if not self.journal.isDone(bias, x, y)]
+            if len(remaining) == 0 and not adaptive:
+                formatted("\nAll points at {} V already taken, skipping"
+                    .format(bias), FORMAT_NOTE)
+                continue
+            elif len(remaining) < len(points):
+                formatted("\nResuming at {} V, {} of {} points left".format(
+                    bias, len(remaining), len(points)), FORMAT_NOTE)
+
             self.hvSetBlocking(self.config.sensorChannel, bias)
+            self.bias = bias
             self.file.setBias(bias)
             formatted("\nNow acquiring with sensor bias at {} V".format(bias),
                 FORMAT_NOTE)
@@ -60,90 +133,270 @@ class UFSDPyDAQ:
             if not self.askSkipQuit(self.config.isHvAuto()):
                 continue
 
-            mode = self.config.mode
-            # Single point
-            if mode == 0:
-                self.acquirePoint(xStart, yStart)
-            # Grid acquisition
-            elif mode == 1:
-                for x in range(xStart, xStop, xStep):
-                    for y in range(yStart, yStop, yStep):
-                        self.acquirePoint(x, y)
-            # Diagonal acquisition
-            elif mode == 2:
-                xRatioEnd = xEnd - xStep
-                yRatioEnd = yEnd - yStep
-                aspectRatio = (yRatioEnd - yStart) / (xRatioEnd - xStart)
-
-                for x in range(xStart, xStop, xStep):
-                    y = yStart + ((x - xStart) * aspectRatio)
-                    self.acquirePoint(x, y)
-            elif mode == 3:
-                points = self.config.getPoints()
-                for point in points:
-                    self.acquirePoint(point[0], point[1])
-
-    def acquirePoint(self, x, y):
-        target = self.config.eventsPerPoint
+            if adaptive:
+                self.scanAdaptive()
+                continue
+            self.scan(remaining)
+            # Next bias on the way back, from where the stage is now
+            if self.config.isPathOptimized():
+                points = points[::-1]
+
+    # List the (x, y) points to acquire, in order, for the configured mode
+    def scanPoints(self):
+        (xStart, xStep, xStop,
+            yStart, yStep, yStop) = self.config.getGrid(inclusive = True)
+
+        mode = self.config.mode
+        # Single point
+        if mode == 0:
+            return [(xStart, yStart)]
+        # Grid acquisition
+        elif mode == 1:
+            return [(x, y) for x in range(xStart, xStop, xStep)
+                for y in range(yStart, yStop, yStep)]
+        # Diagonal acquisition
+        elif mode == 2:
+            xRatioEnd = xStop - xStep
+            yRatioEnd = yStop - yStep
+            aspectRatio = (yRatioEnd - yStart) / (xRatioEnd - xStart)
+
+            return [(x, yStart + ((x - xStart) * aspectRatio))
+                for x in range(xStart, xStop, xStep)]
+        elif mode == 3:
+            return self.config.getPoints()
+        return []
+
+    # Put _points_ in an order that keeps stage travel short (GRID, LIST and
+    # every level of ADAPTIVE only) and say how much that saves
+    def planPoints(self, points):
+        mode = self.config.mode
+        if mode not in [1, 3, 4] or len(points) < 2:
+            return points
+
+        start = None
+        if self.config.isStageAuto():
+            start = self.stage.getPosition()[:2]
+        speed = self.config.stageSpeed
+        if mode == 1:
+            (xStart, xStep, xStop,
+                yStart, yStep, yStop) = self.config.getGrid(inclusive = True)
+            planned = scan.serpentine(range(xStart, xStop, xStep),
+                range(yStart, yStop, yStep))
+        else:
+            planned = scan.order(points, start, speed, True)
+
+        before = scan.travel(points, start, speed, True)
+        after = scan.travel(planned, start, speed, True)
+        formatted("\nScan path {:.1f} mm, about {:.1f} min of stage moves "
+            "(was {:.1f} mm, {:.1f} min)".format(after[0] / 1E3, after[1] / 60,
+            before[0] / 1E3, before[1] / 60), FORMAT_NOTE)
+        return planned
+
+    # MODE = ADAPTIVE: a coarse grid first, then finer and finer ones only
+    # where the figure of merit changes, see scan.Refiner. Points already in
+    # the journal are not taken again, their figure of merit is reused.
+    # Points of the finest grid taken earlier with COARSE_EVENTS are topped
+    # up to MAX_EVENTS, in a point of their own in the file.
+    def scanAdaptive(self):
+        (xStart, xStep, xEnd,
+            yStart, yStep, yEnd) = self.config.getGrid(inclusive = False)
+        level = self.config.adaptiveLevels
+        refiner = scan.Refiner(xStart, xStep, xEnd, yStart, yStep, yEnd,
+            level, self.config.adaptiveThreshold)
+
+        points = refiner.start()
+        while len(points) > 0:
+            target = self.config.coarseEvents
+            if level == 0:
+                target = self.config.eventsPerPoint
+            merits = {}
+            missing = {}
+            for x, y in points:
+                taken = self.journal.taken(self.bias, x, y)
+                merit = self.journal.merit(self.bias, x, y)
+                if merit != None:
+                    merits[(x, y)] = merit
+                if taken < target:
+                    missing[(x, y)] = target - taken
+            remaining = list(missing)
+            formatted("\nScan step ({}, {}) um, {} points ({} left) of {} "
+                "events".format(xStep * 2 ** level, yStep * 2 ** level,
+                len(points), len(remaining), target), FORMAT_NOTE)
+
+            if self.config.isPathOptimized():
+                remaining = self.planPoints(remaining)
+            merits.update(self.scan(remaining,
+                [missing[point] for point in remaining]))
+            points = refiner.refine(merits)
+            level -= 1
+
+    # Go through _points_, moving the stage towards the next one while the
+    # previous one is being written to file. _targets_ holds the events to
+    # take at each point, as for acquirePoint(). Returns the figure of merit
+    # of the points taken as {(x, y): merit}, if there is one (MODE =
+    # ADAPTIVE).
+    def scan(self, points, targets = None):
+        merits = {}
+        if len(points) == 0:
+            return merits
+
+        self.stage.to2d(points[0][0], points[0][1], False)
+        for i, (x, y) in enumerate(points):
+            next = points[i + 1] if i + 1 < len(points) else None
+            target = targets[i] if targets != None else None
+            merit = self.acquirePoint(x, y, next, target)
+            if merit is not None:
+                merits[(x, y)] = merit
+        return merits
+
+    # Acquire _target_ events (MAX_EVENTS if None) at (x, y), once done send
+    # the stage on its way to _next_ (if any) without waiting for it. The
+    # stage is expected to be already moving towards (x, y). Returns the
+    # figure of merit of all events taken at the point, None if skipped or
+    # not scanning adaptively.
+    def acquirePoint(self, x, y, next = None, target = None):
+        if target == None:
+            target = self.config.eventsPerPoint
         formatted("\nNow acquiring {} events at (x = {}, y = {})".format(
             target, x, y), FORMAT_NOTE, "")
 
-        self.stage.to2d(x, y, True)
+        # Never take (and journal) events somewhere else than at (x, y)
+        if not self.reachPoint(x, y):
+            formatted("Stage never got there, stopping. Once it's sorted "
+                "out, --resume takes it from here.", FORMAT_ERROR)
+            self.dgt.stopAcquisition()
+            self.cleanup()
+            exit()
+        readBack = {}
         if self.config.isStageAuto():
-            position = self.stage.position
+            position = self.stage.getPosition()
             formatted("Current position is (x = {:.3f}, y = {:.3f})".format(
                 position[0], position[1]), FORMAT_NOTE)
+            readBack["xStage"], readBack["yStage"] = position[:2]
 
         if not self.askSkipQuit(self.config.isStageAuto()):
+            self.moveToNext(next)
             return
         self.file.setPosition(x, y)
 
         events = 0
+        self.waiter.reset()
+        self.tracker.reset()
+        if self.merit != None:
+            self.merit.reset()
         self.dgt.startAcquisition()
-        while True:
-            events += self.poll(events, target)
-            if events >= target:
-                formatted("Acquired {}/{} events.".format(events,
-                    target), FORMAT_OK, "")
-                break
+        if self.readout != None:
+            self.readout.resetCounters()
+            events = self.readout.run(target)
+        else:
+            while events < target:
+                events += self.poll(events, target)
+        formatted("Acquired {}/{} events.".format(events,
+            target), FORMAT_OK, "")
         self.dgt.stopAcquisition()
+        # Digitizer is done with this point, get going while we write
+        self.moveToNext(next)
+
+        if self.readout != None and self.readout.dropped > 0:
+            formatted("Readout fell behind, dropped {} blocks ({} events)."
+                .format(self.readout.dropped, self.readout.droppedEvents),
+                FORMAT_WARNING)
 
+        self.reportPoint(readBack)
+        # Only once the point is safely on disk
         self.file.write()
+        merit = None
+        if self.merit != None:
+            merit = self.merit.value()
+        self.journal.add(self.bias, x, y, events, merit)
+        # Topped up points count the events taken there before as well
+        if merit is not None:
+            merit = self.journal.merit(self.bias, x, y)
+        return merit
+
+    # Print and store trigger rate and lost events for the current point,
+    # along with _readBack_ values and the sensor bias and current
+    def reportPoint(self, readBack = {}):
+        stats = self.tracker.stats()
+        stats.update(readBack)
+        if self.config.isHvAuto():
+            stats["biasMon"] = self.hv.getVoltage(self.config.sensorChannel)
+            stats["currentMon"] = self.hv.getCurrent(self.config.sensorChannel)
+        lost = stats["lost"]
+        share = 100 * lost / max(stats["triggers"], 1)
+        formatted("Trigger rate {:.1f} Hz, recorded {:.1f} Hz, lost {} "
+            "events ({:.1f}%)".format(stats["triggerRate"],
+            stats["eventRate"], lost, share),
+            FORMAT_WARNING if lost > 0 else FORMAT_OK)
+        self.file.fillPoint(stats)
 
     def poll(self, taken, target):
+        self.waiter.wait() # Don't hammer the digitizer at low rates
         self.dgt.readData() # Update local buffer with data from the digitizer
-
-        size = self.dgt.getNumEvents() # How many events in this block?
-        remaining = min(size, target - taken)
-        for i in range(remaining):
-            data, info = self.dgt.getEvent(i, True) # Get event data and info
-
-            for j in range(18):
-                group = int(j / 9)
-                if data.GrPresent[group] != 1:
-                    continue # If this group was disabled then skip it
-
-                channel = j - (9 * group)
-                block = data.DataGroup[group]
-                size = block.ChSize[channel]
-
-                if channel == 8:
-                    self.file.setTrigger(group,
-                        block.DataChannel[channel], size)
-                else:
-                    self.file.setChannel(j - group,
-                        block.DataChannel[channel], size)
-
-            self.file.fill()
-        return remaining
+        events = self.consume(None, taken, target)
+        self.waiter.update(events)
+        return events
+
+    # Samples stored per row of a decoded block with BRANCH_LAYOUT = ARRAY,
+    # 0 for rows that are dropped
+    def branchLengths(self):
+        if self.config.branchLayout != "ARRAY":
+            return None
+
+        length = self.config.eventSize
+        if self.window != None:
+            length = self.window.rowLengths(length)
+        return self.selector.rows * length
+
+    # Decode and write events from _buffer_ (the digitizer's own if None).
+    # Called by the writer thread when using threaded readout.
+    def consume(self, buffer, taken, target):
+        if self.config.outputFormat == "RAW":
+            return self.dump(buffer, taken, target)
+
+        # Decode the whole block at once, at most as many events as needed
+        samples, info, groups = self.dgt.decodeBlock(buffer, target - taken)
+        self.tracker.update(info)
+        present = groups["GrPresent"]
+        summary, amplitude = None, None
+        if self.reducer != None:
+            summary = self.reducer.reduce(samples, present)
+            amplitude = summary["amplitude"]
+        elif self.merit != None:
+            amplitude = features.amplitudes(samples,
+                self.selector.baselineSamples, self.selector.polarity)
+        keep = self.selector.select(samples, present, amplitude)
+        if self.merit != None:
+            self.merit.add(amplitude, present)
+        if self.window != None:
+            samples, lengths, starts = self.window.apply(samples, present)
+            self.file.fillBlock(samples, present, keep, lengths, starts)
+        else:
+            self.file.fillBlock(samples, present, keep)
+        if summary != None:
+            self.file.fillFeatures(summary)
+        return len(samples)
+
+    # Append the raw block in _buffer_ to file, no decoding. Only whole
+    # events up to the target are kept.
+    def dump(self, buffer, taken, target):
+        data = self.dgt.getBlock(buffer)
+        size, events = x742.truncate(data, target - taken)
+        if events > 0:
+            self.tracker.update(x742.headers(data[:size], events))
+            self.file.writeBlock(data[:size], events)
+        return events
 
     def cleanup(self):
         self.file.close()
+        self.journal.close()
 
         formatted("\nDigitizer cleanup... ", FORMAT_NOTE, "")
         self.dgt.stopAcquisition()
         self.dgt.freeEvent()
         self.dgt.freeBuffer()
+        if self.readout != None:
+            self.readout.release()
         formatted("Done!", FORMAT_OK)
 
         formatted("Closing connection to digitizer... ", FORMAT_NOTE, "")
@@ -178,7 +431,9 @@ class UFSDPyDAQ:
             return False
 
         formatted("Connecting to stage...", FORMAT_NOTE, "")
-        self.stage = stage.Stage(self.config.stageAxes)
+        self.stage = stage.Stage(self.config.stageAxes,
+            interval = self.config.stagePollInterval,
+            timeout = self.config.stageTimeout)
 
         if not self.stage.connected:
             formatted("Fail! Couldn't connect to stage, exiting.",
@@ -191,6 +446,23 @@ class UFSDPyDAQ:
     def programStage(self):
         self.stage.setSpeed(self.config.stageSpeed)
 
+    # Wait for the stage to get to (x, y), sending it there again up to
+    # MOVE_RETRIES times if it doesn't in time. False if it never does.
+    def reachPoint(self, x, y):
+        for attempt in range(MOVE_RETRIES + 1):
+            if attempt > 0:
+                formatted("Stage didn't get there in time, moving again.",
+                    FORMAT_WARNING)
+                self.stage.to2d(x, y, False)
+            if self.stage.wait() != False:
+                return True
+        return False
+
+    # Start moving towards _next_ = (x, y), if any, without waiting
+    def moveToNext(self, next):
+        if next != None:
+            self.stage.to2d(next[0], next[1], False)
+
 # ========================= HIGH VOLTAGE STUFF ================================
 
     def connectHighVoltage(self):
@@ -229,6 +501,8 @@ class UFSDPyDAQ:
 
     def connectDigitizer(self):
         formatted("\nConnecting to digitizer... ", FORMAT_NOTE, "")
+        digitizer.load(self.config.digitizerBackend,
+            self.config.simulationOptions)
         self.dgt = digitizer.Digitizer(self.config.digitizerID)
         if not self.dgt.connected:
             formatted("Fail! Couldn't connect to device, exiting.",
@@ -253,6 +527,8 @@ class UFSDPyDAQ:
         self.dgt.setRecordLength(self.config.eventSize)
         self.dgt.setMaxNumEventsBLT(1023) # Packet size for file transfer
         self.dgt.setAcquisitionMode(0) # Software controlled
+        # Count rejected triggers as well, to keep track of lost events
+        self.dgt.setTriggerCountingMode(1)
         self.dgt.setExtTriggerInputMode(0) # Disable TRG IN trigger
 
         # device.writeRegister(0x8004, 1<<3) # Enable test pattern
@@ -260,8 +536,8 @@ class UFSDPyDAQ:
         self.dgt.setFastTriggerMode(1) # Enable TR0 trigger
         self.dgt.setFastTriggerDigitizing(1) # Digitize TR0
 
-        # Enable or disable groups
-        self.dgt.setGroupEnableMask(0b11)
+        # Enable only groups with channels we keep
+        self.dgt.setGroupEnableMask(self.config.groupMask)
 
         channelOffset = self.config.channelsOffset
         if channelOffset != None:
@@ -322,15 +598,17 @@ class Nothing():
         return bye
 
 if __name__ == "__main__":
-    args = sys.argv
+    # Usage: python main.py [config file] [--resume]
+    args = [arg for arg in sys.argv[1:] if arg != "--resume"]
+    resume = "--resume" in sys.argv
 
     configPath = CONFIG_PATH
-    if len(args) == 2:
-        configPath = args[1]
+    if len(args) == 1:
+        configPath = args[0]
 
     config = io.config.Config(configPath)
 
-    daq = UFSDPyDAQ(config)
+    daq = UFSDPyDAQ(config, resume)
 
     if daq.prepare():
         daq.acquire()
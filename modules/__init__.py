@@ -1,4 +1,5 @@
-from . import digitizer, highvoltage, stage, io
+from . import digitizer, x742, simulator, readout, features, highvoltage, \
+    stage, scan, io
 
 if __name__ == "__main__":
     print("I'm a module, please don't run me alone.")
@@ -1,7 +1,8 @@
 # CAEN DT5742 control module, not all original API features supported.
 
 from ctypes import *
-import time
+import numpy as np
+import time, os
 
 # ===================== PSEUDO STRUCTURES (C INHERITED) =======================
 
@@ -33,6 +34,27 @@ class Group(Structure):
         ("TriggerTimeLag", c_uint32),
         ("StartIndexCell", c_uint16)]
 
+# Block transfer buffer, as allocated by CAEN_DGTZ_MallocReadoutBuffer.
+# Every method dealing with block transfers takes one of these and defaults
+# to the digitizer's own, more of them can be used to keep reading from the
+# board while previous blocks are still being decoded.
+class ReadoutBuffer():
+
+    def __init__(self):
+        # Points to the start of the buffer
+        self.data = POINTER(c_char)()
+        # Size in memory of the buffer
+        self.allocatedSize = c_uint32()
+        # Size of the data transferred by the last readData() call
+        self.size = c_uint32()
+        # Made once, readData() passes it on every block transfer
+        self.sizeRef = byref(self.size)
+        # Events in the last block transfer, filled by getNumEvents(). One
+        # per buffer: with threaded readout the reader counts the events of
+        # a new block while the writer decodes another one.
+        self.eventCount = c_uint32()
+        self.eventCountRef = byref(self.eventCount)
+
 # Event structure, holds groups (up to four, as there are 742 models with)
 # twice as many channels as our own and some stats...
 class Event(Structure):
@@ -50,8 +72,57 @@ class EventInfo(Structure):
         ("EventCounter", c_uint32),
         ("TriggerTimeTag", c_uint32)]
 
+# Our model has two groups, each one with 8 channels plus the digitized TR0.
+# Decoded blocks hold one row per channel: group * GROUP_CHANNELS + channel,
+# so rows 8 and 17 are the trigger copies.
+GROUPS = 2
+GROUP_CHANNELS = 9
+BLOCK_CHANNELS = GROUPS * GROUP_CHANNELS
+# Longest record the DRS4 can take
+MAX_RECORD_LENGTH = 1024
+
+# Trigger time tag tick, in seconds
+TIME_TAG_PERIOD = 8.5E-9
+# Width of the event counter and trigger time tag, both roll over
+COUNTER_BITS = 24
+TIME_TAG_BITS = 32
+
+# Acquisition control register, bit 3 selects what the event counter counts
+ACQUISITION_CONTROL = 0x8100
+COUNT_ALL_TRIGGERS = 1 << 3
+
+# NumPy counterparts of EventInfo and of the per-group stats in Group,
+# used for whole decoded blocks
+INFO_DTYPE = np.dtype([(name, np.uint32) for name, t in EventInfo._fields_])
+GROUP_DTYPE = np.dtype([
+    ("GrPresent", np.uint8),
+    ("ChSize", np.uint32, (GROUP_CHANNELS,)),
+    ("TriggerTimeLag", np.uint32),
+    ("StartIndexCell", np.uint16)])
+
 SO_FILENAME = "libCAENDigitizer.so"
-API = CDLL("/usr/lib/" + SO_FILENAME)
+# Which backend to talk to: CAEN for the real library, SIMULATED for
+# simulator.py. This environment variable, if set, wins over whatever is
+# passed to load(), e.g. UFSD_DIGITIZER=SIMULATED python main.py
+BACKEND_VARIABLE = "UFSD_DIGITIZER"
+BACKENDS = ["CAEN", "SIMULATED"]
+
+API = None
+
+# Load the CAEN_DGTZ_* calls from _backend_. _options_ are passed on to the
+# simulated backend (rate, amplitude, noise, occupancy, seed).
+def load(backend = "CAEN", options = {}):
+    global API
+    backend = os.environ.get(BACKEND_VARIABLE, backend)
+    if backend not in BACKENDS:
+        raise ValueError("Unknown digitizer backend {}".format(backend))
+
+    if backend == "SIMULATED":
+        from . import simulator
+        API = simulator.SimulatedAPI(**options)
+    else:
+        API = CDLL("/usr/lib/" + SO_FILENAME)
+        register(API)
 
 class Digitizer:
 
@@ -68,13 +139,15 @@ class Digitizer:
         # Stores some stats about the event that's currently being processed
         self.eventInfo = EventInfo()
 
+        # Default readout buffer, more can be allocated with newBuffer()
+        self.readout = ReadoutBuffer()
         # Stores the last block of events transferred from the digitizer
-        self.eventBuffer = POINTER(c_char)()
+        self.eventBuffer = self.readout.data
 
-        # Size in memory of the event object
-        self.eventAllocatedSize = c_uint32()
         # Size in memory of the events' block transfer
-        self.eventBufferSize = c_uint32()
+        self.eventAllocatedSize = self.readout.allocatedSize
+        # Size in memory of the last block transfer
+        self.eventBufferSize = self.readout.size
         # Need to create a **void since technically speaking other
         # kinds of Event() esist as well (the CAENDigitizer
         # library supports a multitude of devices, with different Event()
@@ -82,6 +155,24 @@ class Digitizer:
         self.eventVoidPointer = cast(byref(self.eventObject),
             POINTER(c_void_p))
 
+        # Calls made for every block or event are looked up once, and their
+        # argument objects made once and updated in place, see events()
+        self.readDataCall = unchecked(API.CAEN_DGTZ_ReadData)
+        self.getNumEventsCall = unchecked(API.CAEN_DGTZ_GetNumEvents)
+        self.getEventInfoCall = unchecked(API.CAEN_DGTZ_GetEventInfo)
+        self.decodeEventCall = unchecked(API.CAEN_DGTZ_DecodeEvent)
+        self.readMode = c_long(0)
+        self.eventIndex = c_uint32()
+        self.eventInfoRef = byref(self.eventInfo)
+        self.eventPointerRef = byref(self.eventPointer)
+
+        # Samples per channel, as set with setRecordLength()
+        self.recordLength = MAX_RECORD_LENGTH
+        # Reusable arrays filled by decodeBlock(), grown when needed
+        self.blockSamples = None
+        self.blockInfo = None
+        self.blockGroups = None
+
 # ============================= BOARD COMMUNICATION ===========================
 
     # Open connection (at number)
@@ -124,6 +215,20 @@ class Digitizer:
         check(API.CAEN_DGTZ_SetAcquisitionMode(
             self.handle, c_long(mode)))
 
+    # What should the event counter count?
+    # Setting: 0 -> Accepted triggers only
+    # Setting: 1 -> All triggers, including those rejected because the
+    #               board's memory was full. Gaps in the counter then tell
+    #               how many events were lost.
+    def setTriggerCountingMode(self, setting):
+        control = c_uint32()
+        self.readRegister(ACQUISITION_CONTROL, control)
+        if setting:
+            control.value |= COUNT_ALL_TRIGGERS
+        else:
+            control.value &= ~COUNT_ALL_TRIGGERS
+        self.writeRegister(ACQUISITION_CONTROL, control.value)
+
     # Get digitizer info (refer to BoardInfo class)
     def getInfo(self):
         info = BoardInfo()
@@ -135,10 +240,18 @@ class Digitizer:
         check(API.CAEN_DGTZ_AllocateEvent(self.handle, self.eventVoidPointer))
 
     # Allocate space in memory for the events' block transfer
-    def mallocBuffer(self):
+    def mallocBuffer(self, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
         check(API.CAEN_DGTZ_MallocReadoutBuffer(
-            self.handle, byref(self.eventBuffer),
-            byref(self.eventAllocatedSize)))
+            self.handle, byref(buffer.data), byref(buffer.allocatedSize)))
+
+    # Allocate an extra readout buffer and return it
+    def newBuffer(self):
+        buffer = ReadoutBuffer()
+        self.mallocBuffer(buffer)
+        return buffer
 
     # Free memory that was allocated for the event object
     def freeEvent(self):
@@ -146,8 +259,11 @@ class Digitizer:
         check(API.CAEN_DGTZ_FreeEvent(self.handle, ptr))
 
     # Free memory that was allocated for the events' block transfer
-    def freeBuffer(self):
-        check(API.CAEN_DGTZ_FreeReadoutBuffer(byref(self.eventBuffer)))
+    def freeBuffer(self, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
+        check(API.CAEN_DGTZ_FreeReadoutBuffer(byref(buffer.data)))
 
     # Max number of events per block transfer
     # Minimum is 1, maximum is 1023. It's recommended to set it to
@@ -224,6 +340,7 @@ class Digitizer:
     def setRecordLength(self, length):
         check(API.CAEN_DGTZ_SetRecordLength(
             self.handle, c_uint32(length)))
+        self.recordLength = length
 
 # ============================== TRG IN TRIGGER ===============================
 
@@ -292,51 +409,172 @@ class Digitizer:
     def stopAcquisition(self):
         check(API.CAEN_DGTZ_SWStopAcquisition(self.handle))
 
-    # Start an event block transfer and put all data in eventBuffer.
-    # eventBufferSize will contain the length of the event.
-    def readData(self):
-        check(API.CAEN_DGTZ_ReadData(
-            self.handle, c_long(0), self.eventBuffer,
-            byref(self.eventBufferSize)))
+    # Start an event block transfer and put all data in _buffer_
+    # (eventBuffer by default). Its size will contain the length of the block.
+    def readData(self, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
+        check(self.readDataCall(
+            self.handle, self.readMode, buffer.data, buffer.sizeRef))
+
+    # Get the raw content of the last block transfer in _buffer_ (eventBuffer
+    # by default) as a memoryview, without copying it.
+    def getBlock(self, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
+        size = buffer.size.value
+        if size == 0:
+            return memoryview(b"")
+        address = cast(buffer.data, c_void_p).value
+        return memoryview((c_char * size).from_address(address)).cast("B")
 
     # Get the number of EVENTS contained in the last block transfer initiated,
-    # and therefore in eventBuffer.
-    def getNumEvents(self):
-        eventNumber = c_uint32()
-        check(API.CAEN_DGTZ_GetNumEvents(
-            self.handle, self.eventBuffer, self.eventBufferSize,
-            byref(eventNumber)))
+    # and therefore in _buffer_ (eventBuffer by default).
+    def getNumEvents(self, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
+        check(self.getNumEventsCall(
+            self.handle, buffer.data, buffer.size, buffer.eventCountRef))
 
-        return eventNumber.value
+        return buffer.eventCount.value
 
     # Fill the eventInfo object declared in __init__ with stats from
-    # the i-th event in the buffer (and thus from the last block transfer).
+    # the i-th event in _buffer_ (and thus from the last block transfer).
     # At the end of this function eventPointer will point to the i-th event.
-    def getEventInfo(self, index):
-        check(API.CAEN_DGTZ_GetEventInfo(
-            self.handle, self.eventBuffer, self.eventBufferSize, c_uint32(index),
-            byref(self.eventInfo), byref(self.eventPointer)))
+    def getEventInfo(self, index, buffer = None):
+        if buffer == None:
+            buffer = self.readout
+
+        self.eventIndex.value = index
+        check(self.getEventInfoCall(
+            self.handle, buffer.data, buffer.size, self.eventIndex,
+            self.eventInfoRef, self.eventPointerRef))
 
         return self.eventInfo
 
     # Decode the event in eventPointer and put all data in the eventObject
     # created in __init__. eventPointer is filled by calling getEventInfo first.
     def decodeEvent(self):
-        check(API.CAEN_DGTZ_DecodeEvent(
+        check(self.decodeEventCall(
             self.handle, self.eventPointer, self.eventVoidPointer))
 
         return self.eventObject.contents
 
     # Get event data without having to call getEventInfo first. If event
     # info is to be returned as well, pass wantInfo = True.
-    def getEvent(self, index, wantInfo = False):
-        info = self.getEventInfo(index)
+    def getEvent(self, index, wantInfo = False, buffer = None):
+        info = self.getEventInfo(index, buffer)
         event = self.decodeEvent()
         if wantInfo:
             return event, info
         else:
             return event
 
+    # Go through the events in _buffer_ (eventBuffer by default), or only the
+    # first _count_ of them, getting info and decoding each one. Yields
+    # (index, info, event) with info and event as returned by getEventInfo()
+    # and decodeEvent(), overwritten at every step. Same as calling getEvent()
+    # in a loop, minus the per-event method calls and lookups. _size_ is the
+    # number of events in _buffer_ if already known, saves asking again.
+    def events(self, buffer = None, count = None, size = None):
+        if buffer == None:
+            buffer = self.readout
+
+        if size == None:
+            size = self.getNumEvents(buffer)
+        if count != None:
+            size = min(size, count)
+
+        if size == 0:
+            return
+
+        handle, data, length = self.handle, buffer.data, buffer.size
+        getEventInfo, decodeEvent = self.getEventInfoCall, self.decodeEventCall
+        index, info = self.eventIndex, self.eventInfo
+        infoRef, pointerRef = self.eventInfoRef, self.eventPointerRef
+        eventPointer, decoded = self.eventPointer, self.eventVoidPointer
+        # Events are decoded in place, into the one allocateEvent() made
+        event = self.eventObject.contents
+        for i in range(size):
+            index.value = i
+            code = getEventInfo(handle, data, length, index, infoRef,
+                pointerRef)
+            if code == 0:
+                code = decodeEvent(handle, eventPointer, decoded)
+            if code != 0:
+                check(code)
+            yield i, info, event
+
+    # Decode all events in _buffer_ (eventBuffer by default), or only the
+    # first _count_ of them, in one go. Returns three arrays:
+    # - samples, float32 of shape (events, BLOCK_CHANNELS, recordLength)
+    # - info, one INFO_DTYPE record per event
+    # - groups, GROUP_DTYPE records of shape (events, GROUPS)
+    # These are views of arrays owned by the digitizer and reused by the next
+    # call, copy them if they have to outlive it. Rows of groups that are not
+    # present hold stale data, check GrPresent.
+    def decodeBlock(self, buffer = None, count = None):
+        size = self.getNumEvents(buffer)
+        if count != None:
+            size = min(size, count)
+        self.reserveBlock(size)
+
+        samples = self.blockSamples
+        present = self.blockGroups["GrPresent"]
+        sizes = self.blockGroups["ChSize"]
+        lags = self.blockGroups["TriggerTimeLag"]
+        cells = self.blockGroups["StartIndexCell"]
+        # Plain uint32 view of the info records, so each EventInfo can be
+        # copied over as a whole
+        info = self.blockInfo.view(np.uint32).reshape(-1, len(INFO_DTYPE))
+        current = np.ctypeslib.as_array(
+            cast(pointer(self.eventInfo), POINTER(c_uint32)),
+            shape = (len(INFO_DTYPE),))
+
+        base = samples.ctypes.data
+        rowBytes = samples.strides[1]
+        eventBytes = samples.strides[0]
+        for i, _, event in self.events(buffer, size = size):
+            info[i] = current
+
+            for g in range(GROUPS):
+                present[i, g] = event.GrPresent[g]
+                if present[i, g] != 1:
+                    continue
+
+                group = event.DataGroup[g]
+                sizes[i, g] = group.ChSize
+                lags[i, g] = group.TriggerTimeLag
+                cells[i, g] = group.StartIndexCell
+
+                row = base + i * eventBytes + g * GROUP_CHANNELS * rowBytes
+                for c in range(GROUP_CHANNELS):
+                    length = min(group.ChSize[c], self.recordLength)
+                    memmove(row + c * rowBytes, group.DataChannel[c],
+                        length * sizeof(c_float))
+
+        return (samples[:size], self.blockInfo[:size],
+            self.blockGroups[:size])
+
+    # Make sure decodeBlock() arrays can hold _size_ events of the current
+    # record length
+    def reserveBlock(self, size):
+        samples = self.blockSamples
+        capacity = size
+        if samples is not None:
+            if samples.shape[0] >= size and \
+                samples.shape[2] == self.recordLength:
+                return
+            capacity = max(size, samples.shape[0])
+
+        self.blockSamples = np.zeros(
+            (capacity, BLOCK_CHANNELS, self.recordLength), np.float32)
+        self.blockInfo = np.zeros(capacity, INFO_DTYPE)
+        self.blockGroups = np.zeros((capacity, GROUPS), GROUP_DTYPE)
+
     # Load correction tables from digitizer's memory at right frequency.
     def loadCorrectionData(self, frequency):
         check(API.CAEN_DGTZ_LoadDRS4CorrectionData(
@@ -350,61 +588,119 @@ class Digitizer:
         check(API.CAEN_DGTZ_EnableDRS4Correction(
             self.handle))
 
+# ============================== INTERRUPTS ===================================
+
+    # Have the board raise an interrupt once _events_ events are ready.
+    # State: 0 -> Disabled
+    # State: 1 -> Enabled
+    # Mode: 0 -> Release On Register Access (RORA)
+    # Mode: 1 -> Release On Acknowledge (ROAK)
+    # NOTE: interrupts only make it to the PC through the optical link.
+    def setInterruptConfig(self, state, events, level = 1, statusID = 0xAAAA,
+        mode = 0):
+        check(API.CAEN_DGTZ_SetInterruptConfig(
+            self.handle, c_long(state), c_uint8(level), c_uint32(statusID),
+            c_uint16(events), c_long(mode)))
+
+    # Block until the board raises an interrupt or _timeout_ (ms) runs out.
+    # Returns False on timeout.
+    def irqWait(self, timeout):
+        code = API.CAEN_DGTZ_IRQWait(self.handle, c_uint32(timeout))
+        if code == ERROR_TIMEOUT:
+            return False
+        check(code)
+        return True
+
 # ======================== UTIL FUNCTIONS =====================================
 
+# Returned by calls that gave up waiting (CAEN_DGTZ_Timeout)
+ERROR_TIMEOUT = -18
+
 # Simply check that the API function returned 0L
 def check(code):
     if code != 0:
         print("\nDigitizer: an error occurred during the last operation. \
             Code: {}".format(code))
 
-# All digitizer functions return a long, indicating the operation outcome.
-# Make ctypes be aware of that.
-def register(*ext):
-    for func in ext:
-        func.restype = c_long
-
-def __init__():
-    register(API.CAEN_DGTZ_OpenDigitizer,
-        API.CAEN_DGTZ_CloseDigitizer,
-        API.CAEN_DGTZ_Reset,
-        API.CAEN_DGTZ_WriteRegister,
-        API.CAEN_DGTZ_ReadRegister,
-        API.CAEN_DGTZ_SetAcquisitionMode,
-        API.CAEN_DGTZ_GetInfo,
-        API.CAEN_DGTZ_AllocateEvent,
-        API.CAEN_DGTZ_MallocReadoutBuffer,
-        API.CAEN_DGTZ_FreeEvent,
-        API.CAEN_DGTZ_FreeReadoutBuffer,
-        API.CAEN_DGTZ_SetMaxNumEventsBLT,
+# Argument types of every call we make, so that ctypes converts and checks
+# arguments without guessing. Enums are passed as c_long, as they always were.
+HANDLE = c_int
+PROTOTYPES = {
+    "CAEN_DGTZ_OpenDigitizer": [c_long, c_int, c_int, c_uint32,
+        POINTER(HANDLE)],
+    "CAEN_DGTZ_CloseDigitizer": [HANDLE],
+    "CAEN_DGTZ_Reset": [HANDLE],
+    "CAEN_DGTZ_WriteRegister": [HANDLE, c_uint32, c_uint32],
+    "CAEN_DGTZ_ReadRegister": [HANDLE, c_uint32, POINTER(c_uint32)],
+    "CAEN_DGTZ_SetAcquisitionMode": [HANDLE, c_long],
+    "CAEN_DGTZ_GetInfo": [HANDLE, POINTER(BoardInfo)],
+    "CAEN_DGTZ_AllocateEvent": [HANDLE, POINTER(c_void_p)],
+    "CAEN_DGTZ_MallocReadoutBuffer": [HANDLE, POINTER(POINTER(c_char)),
+        POINTER(c_uint32)],
+    "CAEN_DGTZ_FreeEvent": [HANDLE, POINTER(c_void_p)],
+    "CAEN_DGTZ_FreeReadoutBuffer": [POINTER(POINTER(c_char))],
+    "CAEN_DGTZ_SetMaxNumEventsBLT": [HANDLE, c_uint32],
 #
-        API.CAEN_DGTZ_SetFastTriggerMode,
-        API.CAEN_DGTZ_SetFastTriggerDigitizing,
-        API.CAEN_DGTZ_SetGroupFastTriggerDCOffset,
-        API.CAEN_DGTZ_SetGroupFastTriggerThreshold,
-        API.CAEN_DGTZ_SetPostTriggerSize,
-        API.CAEN_DGTZ_SetRecordLength,
+    "CAEN_DGTZ_SetFastTriggerMode": [HANDLE, c_long],
+    "CAEN_DGTZ_SetFastTriggerDigitizing": [HANDLE, c_long],
+    "CAEN_DGTZ_SetGroupFastTriggerDCOffset": [HANDLE, c_uint32, c_uint32],
+    "CAEN_DGTZ_SetGroupFastTriggerThreshold": [HANDLE, c_uint32, c_uint32],
+    "CAEN_DGTZ_SetPostTriggerSize": [HANDLE, c_uint32],
+    "CAEN_DGTZ_SetRecordLength": [HANDLE, c_uint32],
 #
-        API.CAEN_DGTZ_SetExtTriggerInputMode,
+    "CAEN_DGTZ_SetExtTriggerInputMode": [HANDLE, c_long],
 #
-        API.CAEN_DGTZ_SetTriggerPolarity,
+    "CAEN_DGTZ_SetTriggerPolarity": [HANDLE, c_uint32, c_long],
 #
-        API.CAEN_DGTZ_SendSWtrigger,
-        API.CAEN_DGTZ_SetDRS4SamplingFrequency,
-        API.CAEN_DGTZ_SetGroupEnableMask,
-        API.CAEN_DGTZ_SetChannelDCOffset,
-        API.CAEN_DGTZ_GetChannelDCOffset,
-        API.CAEN_DGTZ_SWStartAcquisition,
-        API.CAEN_DGTZ_SWStopAcquisition,
-        API.CAEN_DGTZ_ReadData,
-        API.CAEN_DGTZ_GetNumEvents,
-        API.CAEN_DGTZ_GetEventInfo,
-        API.CAEN_DGTZ_DecodeEvent,
-        API.CAEN_DGTZ_LoadDRS4CorrectionData,
-        API.CAEN_DGTZ_EnableDRS4Correction)
+    "CAEN_DGTZ_SendSWtrigger": [HANDLE],
+    "CAEN_DGTZ_SetDRS4SamplingFrequency": [HANDLE, c_long],
+    "CAEN_DGTZ_SetGroupEnableMask": [HANDLE, c_uint32],
+    "CAEN_DGTZ_SetChannelDCOffset": [HANDLE, c_uint32, c_uint32],
+    "CAEN_DGTZ_GetChannelDCOffset": [HANDLE, c_uint32, POINTER(c_uint32)],
+    "CAEN_DGTZ_SWStartAcquisition": [HANDLE],
+    "CAEN_DGTZ_SWStopAcquisition": [HANDLE],
+    "CAEN_DGTZ_ReadData": [HANDLE, c_long, POINTER(c_char),
+        POINTER(c_uint32)],
+    "CAEN_DGTZ_GetNumEvents": [HANDLE, POINTER(c_char), c_uint32,
+        POINTER(c_uint32)],
+    "CAEN_DGTZ_GetEventInfo": [HANDLE, POINTER(c_char), c_uint32, c_uint32,
+        POINTER(EventInfo), POINTER(POINTER(c_char))],
+    "CAEN_DGTZ_DecodeEvent": [HANDLE, POINTER(c_char), POINTER(c_void_p)],
+    "CAEN_DGTZ_LoadDRS4CorrectionData": [HANDLE, c_long],
+    "CAEN_DGTZ_EnableDRS4Correction": [HANDLE],
+    "CAEN_DGTZ_SetInterruptConfig": [HANDLE, c_long, c_uint8, c_uint32,
+        c_uint16, c_long],
+    "CAEN_DGTZ_IRQWait": [HANDLE, c_uint32]}
+
+# All digitizer functions return a long, indicating the operation outcome.
+# Make ctypes be aware of that, and of what they take.
+def register(library):
+    for name, arguments in PROTOTYPES.items():
+        func = getattr(library, name)
+        func.restype = c_long
+        func.argtypes = arguments
+
+# Copy of _function_ without argtypes, for hot paths that only ever pass
+# ctypes objects of the declared types. ctypes then has nothing to convert
+# and skips checking each argument, which takes longer than the call itself
+# (see benchmarks/calls.py). Anything that isn't a ctypes function, like the
+# simulated backend's calls, is returned as it is.
+def unchecked(function):
+    if getattr(function, "argtypes", None) == None:
+        return function
+
+    copy = type(function)(cast(function, c_void_p).value)
+    copy.restype = function.restype
+    return copy
 
 if __name__ == "__main__":
     print("I'm a module, please don't run me alone.")
     exit()
 else:
-    print("[Digitizer ok] ", end = "")
+    # Nothing here can stop the import, no board might just mean we
+    # are going to simulate one later on
+    try:
+        load()
+        print("[Digitizer ok] ", end = "")
+    except OSError:
+        print("[Digitizer: no {}] ".format(SO_FILENAME), end = "")
@@ -0,0 +1,228 @@
+# Online reduction of decoded blocks: a handful of per-channel quantities for
+# every event, computed with NumPy over the whole block at once. Meant for
+# quick-look analysis and position maps, the waveforms stay the reference.
+
+import numpy as np
+from .digitizer import GROUPS, GROUP_CHANNELS
+
+# Feature names, in the order they are computed, and their units
+FEATURES = ["baseline", "noise", "amplitude", "riseTime", "charge", "time"]
+UNITS = {"baseline": "ADC", "noise": "ADC", "amplitude": "ADC",
+    "riseTime": "ns", "charge": "ADC ns", "time": "ns"}
+
+# Samples at the start of the record used for the baseline and noise
+BASELINE_SAMPLES = 100
+# Constant fraction of the amplitude the time of arrival is taken at
+CFD_FRACTION = 0.5
+# Rise time is measured between these fractions of the amplitude
+RISE_LOW, RISE_HIGH = 0.1, 0.9
+# Charge is integrated from this long before the peak to this long after, ns
+CHARGE_WINDOW = (2.0, 4.0)
+# Pulses from the LGADs (and the NIM TR0) are negative going
+POLARITY = -1
+
+# The TR0 copy is a NIM signal, negative going whatever the sensor does
+TRIGGER_POLARITY = -1
+# Smallest TR0 pulse taken for an edge, ADC counts. A NIM pulse is well
+# above it, noise on an undigitized or missing TR0 well below.
+TRIGGER_MIN_AMPLITUDE = 200
+
+# Waveforms per group besides its TR0 copy, in the last row of the group
+CHANNELS = GROUPS * (GROUP_CHANNELS - 1)
+TRIGGERS = GROUPS
+
+class Reducer():
+
+    # _frequency_ is the sampling frequency in MHz
+    def __init__(self, frequency, baselineSamples = BASELINE_SAMPLES,
+        fraction = CFD_FRACTION, window = CHARGE_WINDOW, polarity = POLARITY):
+        self.period = 1E3 / frequency # ns
+        self.baselineSamples = baselineSamples
+        self.fraction = fraction
+        self.window = window
+        self.polarity = polarity
+
+    # Reduce a block as returned by Digitizer.decodeBlock(): _samples_ with
+    # shape (events, rows, length) and _present_ with shape (events, groups).
+    # Returns a dict of (events, rows) float32 arrays, one per feature, in the
+    # same row order as _samples_. Rows of absent groups are all zeros.
+    def reduce(self, samples, present):
+        n, rows, length = samples.shape
+        features = {name: np.zeros((n, rows), np.float32)
+            for name in FEATURES}
+        if n == 0 or length == 0:
+            return features
+
+        head = samples[..., :min(self.baselineSamples, length)]
+        baseline = head.mean(axis = -1)
+        features["baseline"] = baseline
+        features["noise"] = head.std(axis = -1)
+
+        # Positive going from here on
+        signal = self.polarity * (samples - baseline[..., None])
+        peak = signal.argmax(axis = -1)
+        amplitude = np.take_along_axis(signal, peak[..., None], -1)[..., 0]
+        features["amplitude"] = amplitude
+
+        low = crossing(signal, peak, RISE_LOW * amplitude)
+        high = crossing(signal, peak, RISE_HIGH * amplitude)
+        features["riseTime"] = (high - low) * self.period
+        features["time"] = crossing(signal, peak,
+            self.fraction * amplitude) * self.period
+
+        before, after = (int(round(w / self.period)) for w in self.window)
+        index = np.arange(length)
+        inside = ((index >= (peak - before)[..., None]) &
+            (index <= (peak + after)[..., None]))
+        features["charge"] = np.where(inside, signal, 0).sum(axis = -1) * \
+            self.period
+
+        # Groups not read out have no samples to speak of
+        absent = np.repeat(present == 0, GROUP_CHANNELS, axis = 1)[:, :rows]
+        for name in FEATURES:
+            values = features[name].astype(np.float32, copy = False)
+            values[absent] = 0
+            features[name] = values
+
+        return features
+
+# Decides which waveforms of a decoded block get stored: only the _channels_
+# (0..15) and _triggers_ (0..1) asked for and, with a _threshold_ (ADC counts)
+# above 0, only channels with a pulse at least that big. Triggers are never
+# suppressed, as they are needed to time pulses.
+class Selector():
+
+    def __init__(self, channels = range(CHANNELS), triggers = range(TRIGGERS),
+        threshold = 0, baselineSamples = BASELINE_SAMPLES, polarity = POLARITY):
+        self.rows = np.zeros(GROUPS * GROUP_CHANNELS, bool)
+        self.rows[[channelRow(c) for c in channels]] = True
+        self.rows[[triggerRow(t) for t in triggers]] = True
+        self.triggerRows = np.zeros_like(self.rows)
+        self.triggerRows[[triggerRow(t) for t in range(TRIGGERS)]] = True
+
+        self.threshold = threshold
+        self.baselineSamples = baselineSamples
+        self.polarity = polarity
+
+    # Returns an (events, rows) boolean array, True for waveforms to keep.
+    # Arguments as for Reducer.reduce(), _amplitude_ can be taken from its
+    # output to save working it out again.
+    def select(self, samples, present, amplitude = None):
+        rows = samples.shape[1]
+        keep = np.repeat(present != 0, GROUP_CHANNELS, axis = 1)[:, :rows]
+        keep &= self.rows[:rows]
+        if self.threshold > 0:
+            if amplitude is None:
+                amplitude = amplitudes(samples, self.baselineSamples,
+                    self.polarity)
+            keep &= (amplitude >= self.threshold) | self.triggerRows[:rows]
+        return keep
+
+# Cuts a region of interest out of every waveform of a decoded block.
+# _starts_ and _lengths_ (samples) hold one value for all channels or one per
+# channel, a length of 0 keeps the whole record. With _recenter_ channel
+# starts count from the TR0 edge of their group instead of the start of the
+# record. TR0 copies get their own _triggerStart_ and _triggerLength_, never
+# recentered.
+class Window():
+
+    def __init__(self, starts = [0], lengths = [0], recenter = False,
+        triggerStart = 0, triggerLength = 0):
+        channels = [channelRow(c) for c in range(CHANNELS)]
+        triggers = [triggerRow(t) for t in range(TRIGGERS)]
+
+        self.starts = np.zeros(GROUPS * GROUP_CHANNELS, int)
+        self.starts[channels] = np.broadcast_to(starts, CHANNELS)
+        self.starts[triggers] = triggerStart
+        self.lengths = np.zeros_like(self.starts)
+        self.lengths[channels] = np.broadcast_to(lengths, CHANNELS)
+        self.lengths[triggers] = triggerLength
+
+        self.recenter = np.zeros(len(self.starts), bool)
+        self.recenter[channels] = recenter
+
+    # Returns the windowed samples, with shape (events, rows, longest window),
+    # the window length of each row and where each window starts in the
+    # original record, with shape (events, rows). Windows are shifted back
+    # inside the record when needed. _present_ (events, groups) tells which
+    # groups are in each event, windows of groups with no TR0 edge stay at
+    # their nominal start.
+    def apply(self, samples, present):
+        n, rows, length = samples.shape
+        lengths = self.rowLengths(length)[:rows]
+
+        starts = np.broadcast_to(self.starts[:rows], (n, rows))
+        if self.recenter.any():
+            edges = np.rint(triggerEdges(samples, present)).astype(int)
+            group = np.arange(rows) // GROUP_CHANNELS
+            starts = starts + self.recenter[:rows] * edges[:, group]
+        starts = np.clip(starts, 0, length - lengths)
+
+        index = starts[..., None] + np.arange(lengths.max())
+        index = np.minimum(index, length - 1)
+        return np.take_along_axis(samples, index, -1), lengths, starts
+
+    # Window length of each row for records of _length_ samples
+    def rowLengths(self, length):
+        return np.where(self.lengths > 0, np.minimum(self.lengths, length),
+            length)
+
+# Fractional sample index of the TR0 edge of each group, half way through
+# the leading edge, with shape (events, groups). 0 where there is no edge:
+# group not in the event (_present_), or no TR0 pulse to speak of.
+def triggerEdges(samples, present, baselineSamples = BASELINE_SAMPLES,
+    minAmplitude = TRIGGER_MIN_AMPLITUDE):
+    rows = [triggerRow(t) for t in range(TRIGGERS)]
+    trigger = samples[:, rows]
+    baseline = trigger[..., :baselineSamples].mean(axis = -1)
+    signal = TRIGGER_POLARITY * (trigger - baseline[..., None])
+    peak = signal.argmax(axis = -1)
+    amplitude = np.take_along_axis(signal, peak[..., None], -1)[..., 0]
+    edges = crossing(signal, peak, amplitude / 2)
+    found = (present[:, :TRIGGERS] != 0) & (amplitude >= minAmplitude)
+    return np.where(found, edges, 0)
+
+# Row of a decoded block holding channel _c_ (0..15) or trigger _t_ (0..1)
+def channelRow(c):
+    return (c // (GROUP_CHANNELS - 1)) * GROUP_CHANNELS + \
+        c % (GROUP_CHANNELS - 1)
+
+def triggerRow(t):
+    return t * GROUP_CHANNELS + GROUP_CHANNELS - 1
+
+# Pulse height above the baseline of every waveform in _samples_, the cheap
+# part of Reducer.reduce()
+def amplitudes(samples, baselineSamples = BASELINE_SAMPLES,
+    polarity = POLARITY):
+    baseline = samples[..., :baselineSamples].mean(axis = -1)
+    if polarity < 0:
+        return baseline - samples.min(axis = -1)
+    return samples.max(axis = -1) - baseline
+
+# Where _signal_ last rises through _level_ before _peak_, as a fractional
+# sample index interpolated between the two samples around the crossing.
+# All arguments but _signal_ have one value per waveform. Waveforms that
+# never cross give 0.
+def crossing(signal, peak, level):
+    length = signal.shape[-1]
+    index = np.arange(length)
+    below = (signal < level[..., None]) & (index < peak[..., None])
+    found = below.any(axis = -1)
+
+    # Last sample below the level, the next one is at or above it
+    last = length - 1 - below[..., ::-1].argmax(axis = -1)
+    last = np.where(found, last, 0)
+    following = np.minimum(last + 1, length - 1)
+
+    s0 = np.take_along_axis(signal, last[..., None], -1)[..., 0]
+    s1 = np.take_along_axis(signal, following[..., None], -1)[..., 0]
+    step = s1 - s0
+    fraction = np.divide(level - s0, step, out = np.zeros_like(step),
+        where = step != 0)
+    return np.where(found, last + fraction, 0)
+
+if __name__ == "__main__":
+    print("I'm a module, please don't run me alone.")
+    exit()
+else:
+    print("[Features ok] ", end = "")
@@ -1,8 +1,13 @@
 # CAEN DT1471ET control module, not all original features supported.
 
-import pyvisa as pv
 import time
 
+# Missing PyVISA is only a problem if we actually try to use the power supply
+try:
+    import pyvisa as pv
+except ImportError:
+    pv = None
+
 # Tolerance for voltage target, setting function will return once
 # the difference between set voltage and actual output is less than this
 VOLTAGE_TOLERANCE = 1.5 # Volt
@@ -15,6 +20,9 @@ class HighVoltage():
     def __init__(self, board, resource = None):
         self.board = board
         self.connected = False
+        if pv == None:
+            return
+
         self.rm = pv.ResourceManager("@py")
 
         # If no VISA resource is specified when instantiating the class
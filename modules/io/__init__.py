@@ -1,4 +1,4 @@
-from . import config, tree
+from . import config, raw, writer, shards, reader, process, journal
 
 if __name__ == "__main__":
     print("I'm a module, please don't run me alone.")
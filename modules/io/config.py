@@ -20,6 +20,20 @@ class Config():
             if len(self.acq["X_LIST"]) != len(self.acq["Y_LIST"]):
                 print("Lists have to be the same length... Exiting")
                 exit()
+
+            channels = self.keptChannels + [t * 8 for t in self.keptTriggers]
+            if len(channels) == 0 or not all(0 <= c < 16 for c in channels):
+                print("Channels have to be 0 to 15, triggers 0 or 1... Exiting")
+                exit()
+
+            if self.mode == 4 and self.outputFormat == "RAW":
+                print("ADAPTIVE mode needs decoded data, not RAW... Exiting")
+                exit()
+
+            for key in ["ROI_START", "ROI_LENGTH"]:
+                if len(self.acq.get(key, [0])) not in [1, 16]:
+                    print("{} needs 1 or 16 values... Exiting".format(key))
+                    exit()
         else:
             self.loadDefaults()
 
@@ -36,6 +50,15 @@ class Config():
             for k, param in data.items():
                 print("{}: {}".format(k, param))
 
+    # Every section, as stored along with the data
+    def asDict(self):
+        return {"ACQUISITION": self.acq, "DIGITIZER": self.dgt,
+            "HIGHVOLTAGE": self.hv, "STAGE": self.stage}
+
+    # Keys that came after the first release default to what the DAQ did
+    # before they existed, here and in the fallbacks of the getters below,
+    # so that older config files keep giving the same output. config.ini
+    # has the recommended settings.
     def loadDefaults(self):
         acq, dgt, hv, stage = {}, {}, {}, {}
 
@@ -47,11 +70,37 @@ class Config():
         acq["X_STEP"], acq["Y_STEP"] = 10, 10
 
         acq["X_LIST"], acq["Y_LIST"] = [0], [0]
+        acq["OPTIMIZE_PATH"] = False
+        acq["ADAPTIVE_LEVELS"] = 3
+        acq["ADAPTIVE_THRESHOLD"] = 10 # %
+        acq["COARSE_EVENTS"] = acq["MAX_EVENTS"]
 
         acq["DATA_PATH"] = ""
         acq["FILENAME"] = "output"
+        acq["OUTPUT"] = "ROOT"
+        acq["SHARD_POINTS"] = 0
+        acq["SAMPLE_TYPE"] = "DOUBLE"
+        acq["SAMPLE_SCALE"], acq["SAMPLE_OFFSET"] = [1], [0]
+        acq["BRANCH_LAYOUT"] = "VECTOR"
+        acq["COMPRESSION"] = "NONE"
+        acq["COMPRESSION_LEVEL"] = 0
+        acq["BASKET_SIZE"] = 0 # ROOT's own
+        acq["AUTO_FLUSH"] = 0 # ROOT's own
+        acq["AUTO_SAVE"] = 0
+        acq["FEATURES"] = False
+        acq["BASELINE_SAMPLES"] = 100
+        acq["CFD_FRACTION"] = 50
+        acq["CHARGE_WINDOW"] = [2, 4]
+        acq["PULSE_POLARITY"] = "NEGATIVE"
+        acq["ZERO_SUPPRESSION"] = 0
+        acq["ROI_START"], acq["ROI_LENGTH"] = [0], [0]
+        acq["ROI_FROM_TRIGGER"] = False
+        acq["TRIGGER_ROI_START"], acq["TRIGGER_ROI_LENGTH"] = 0, 0
 #
         dgt["DEVICE_ID"] = 0
+        dgt["BACKEND"] = "CAEN"
+        dgt["CHANNELS"] = list(range(16))
+        dgt["TRIGGERS"] = [0, 1]
 
         dgt["TRIGGER_THRESHOLD"] = 24894
         dgt["TRIGGER_OFFSET"] = 32768
@@ -61,6 +110,12 @@ class Config():
         dgt["USE_INTERNAL_CORRECTION"] = True
         dgt["POST_TRIGGER_DELAY"] = 50
         dgt["CHANNEL_DC_OFFSET"] = 45000
+        dgt["THREADED_READOUT"] = False
+        dgt["READOUT_BUFFERS"] = 2
+        dgt["WAIT_MODE"] = "POLL"
+        dgt["WRITER_PROCESS"] = False
+        dgt["WRITER_SLOTS"] = 4
+        dgt["WRITER_SLOT_EVENTS"] = 128
 #
         hv["MANUAL"] = False
         hv["DEVICE_ID"] = 0
@@ -75,6 +130,8 @@ class Config():
 
         stage["X_AXIS"], stage["Y_AXIS"] = 1, 0
         stage["SPEED"] = 1500 # steps/min
+        stage["POLL_INTERVAL"] = 100 # ms
+        stage["MOVE_TIMEOUT"] = 900 # s
 
         self.acq, self.dgt, self.hv, self.stage = acq, dgt, hv, stage
 
@@ -92,6 +149,28 @@ class Config():
         return (self.acq["X_START"], xStep, xStop,
             self.acq["Y_START"], yStep, yStop)
 
+    # Visit GRID and LIST points in the order that keeps travel short
+    def isPathOptimized(self):
+        return self.acq.get("OPTIMIZE_PATH", False)
+
+    # MODE = ADAPTIVE: times the step is halved from the coarse grid down
+    # to X_STEP, Y_STEP
+    @property
+    def adaptiveLevels(self):
+        return self.acq.get("ADAPTIVE_LEVELS", 3)
+
+    # MODE = ADAPTIVE: change of the figure of merit across a cell, as a
+    # fraction of its largest value, above which the cell is refined
+    @property
+    def adaptiveThreshold(self):
+        return self.acq.get("ADAPTIVE_THRESHOLD", 10) / 100
+
+    # MODE = ADAPTIVE: events per point until the finest grid, where it is
+    # MAX_EVENTS
+    @property
+    def coarseEvents(self):
+        return self.acq.get("COARSE_EVENTS", self.eventsPerPoint)
+
     def getPoints(self):
         return list(zip(self.acq["X_LIST"],
             self.acq["Y_LIST"]))
@@ -104,6 +183,86 @@ class Config():
     def outputFile(self):
         return self.acq["FILENAME"]
 
+    @property
+    def outputFormat(self):
+        return self.acq.get("OUTPUT", "ROOT")
+
+    # Points per output file, 0 for a single file
+    @property
+    def shardPoints(self):
+        return self.acq.get("SHARD_POINTS", 0)
+
+    @property
+    def sampleType(self):
+        return self.acq.get("SAMPLE_TYPE", "DOUBLE")
+
+    @property
+    def sampleScales(self):
+        return self.acq.get("SAMPLE_SCALE", [1])
+
+    @property
+    def sampleOffsets(self):
+        return self.acq.get("SAMPLE_OFFSET", [0])
+
+    @property
+    def branchLayout(self):
+        return self.acq.get("BRANCH_LAYOUT", "VECTOR")
+
+    @property
+    def compressionAlgorithm(self):
+        return self.acq.get("COMPRESSION", "NONE")
+
+    @property
+    def compressionLevel(self):
+        return self.acq.get("COMPRESSION_LEVEL", 0)
+
+    # Buffering of the wfm tree, 0 leaves it to ROOT
+    @property
+    def basketSize(self):
+        return self.acq.get("BASKET_SIZE", 0)
+
+    @property
+    def autoFlush(self):
+        return self.acq.get("AUTO_FLUSH", 0)
+
+    @property
+    def autoSave(self):
+        return self.acq.get("AUTO_SAVE", 0)
+
+    def isFeatureEnabled(self):
+        return self.acq.get("FEATURES", False)
+
+    # Settings for features.Reducer, only the ones that are given
+    @property
+    def featureOptions(self):
+        options = {}
+        if "BASELINE_SAMPLES" in self.acq:
+            options["baselineSamples"] = self.acq["BASELINE_SAMPLES"]
+        if "CFD_FRACTION" in self.acq:
+            options["fraction"] = self.acq["CFD_FRACTION"] / 100
+        if "CHARGE_WINDOW" in self.acq:
+            options["window"] = tuple(self.acq["CHARGE_WINDOW"])
+        if "PULSE_POLARITY" in self.acq:
+            options["polarity"] = POLARITY_PARAM[self.acq["PULSE_POLARITY"]]
+        return options
+
+    # Amplitude (ADC counts) below which channels are stored empty, 0 is off
+    @property
+    def suppressionThreshold(self):
+        return self.acq.get("ZERO_SUPPRESSION", 0)
+
+    # Settings for features.Window, None if waveforms are stored whole
+    @property
+    def roiOptions(self):
+        options = {"starts": self.acq.get("ROI_START", [0]),
+            "lengths": self.acq.get("ROI_LENGTH", [0]),
+            "recenter": self.acq.get("ROI_FROM_TRIGGER", False),
+            "triggerStart": self.acq.get("TRIGGER_ROI_START", 0),
+            "triggerLength": self.acq.get("TRIGGER_ROI_LENGTH", 0)}
+        if not any(options["lengths"]) and options["triggerLength"] == 0:
+            return None
+        return options
+
     @property
     def eventsPerPoint(self):
         return self.acq["MAX_EVENTS"]
@@ -116,6 +275,41 @@ class Config():
     def digitizerID(self):
         return self.dgt["DEVICE_ID"]
 
+    @property
+    def digitizerBackend(self):
+        return self.dgt.get("BACKEND", "CAEN")
+
+    # Settings for the simulated digitizer, only the ones that are given
+    @property
+    def simulationOptions(self):
+        options = {}
+        for key, option in [("SIMULATED_RATE", "rate"),
+            ("SIMULATED_AMPLITUDE", "amplitude"),
+            ("SIMULATED_NOISE", "noise")]:
+            if key in self.dgt:
+                options[option] = self.dgt[key]
+        if "SIMULATED_OCCUPANCY" in self.dgt:
+            options["occupancy"] = self.dgt["SIMULATED_OCCUPANCY"] / 100
+        return options
+
+    @property
+    def keptChannels(self):
+        return self.dgt.get("CHANNELS", list(range(16)))
+
+    @property
+    def keptTriggers(self):
+        return self.dgt.get("TRIGGERS", [0, 1])
+
+    # Each group holds 8 channels and one TR0 copy, read out those needed
+    @property
+    def groupMask(self):
+        mask = 0
+        for c in self.keptChannels:
+            mask |= 1 << (c // 8)
+        for t in self.keptTriggers:
+            mask |= 1 << t
+        return mask
+
     @property
     def frequency(self):
         return self.dgt["FREQUENCY"]
@@ -151,6 +345,29 @@ class Config():
             return None
         return value
 
+    def isReadoutThreaded(self):
+        return self.dgt.get("THREADED_READOUT", False)
+
+    @property
+    def readoutBuffers(self):
+        return self.dgt.get("READOUT_BUFFERS", 2)
+
+    @property
+    def waitMode(self):
+        return self.dgt.get("WAIT_MODE", "POLL")
+
+    # Decoded blocks are written by a separate process, see io.process
+    def isWriterProcess(self):
+        return self.dgt.get("WRITER_PROCESS", False)
+
+    @property
+    def writerSlots(self):
+        return self.dgt.get("WRITER_SLOTS", 4)
+
+    @property
+    def writerSlotEvents(self):
+        return self.dgt.get("WRITER_SLOT_EVENTS", 128)
+
     @property
     def hvID(self):
         return self.hv["DEVICE_ID"]
@@ -194,12 +411,25 @@ class Config():
     def stageSpeed(self):
         return self.stage["SPEED"]
 
+    # How often axes are polled while waiting for a move to end, ms
+    @property
+    def stagePollInterval(self):
+        return self.stage.get("POLL_INTERVAL", 100)
+
+    # How long to wait for a move to end, s
+    @property
+    def stageTimeout(self):
+        return self.stage.get("MOVE_TIMEOUT", 900)
+
     def isStageAuto(self):
         return not self.stage["MANUAL"]
 
 BOOLEAN_PARAM = {"YES": True, "NO": False}
-MODE_PARAM = {"SINGLE": 0, "GRID": 1, "DIAG": 2, "LIST": 3}
-KEYS_ARRAY = ["SENSOR_BIAS", "X_LIST", "Y_LIST"]
+MODE_PARAM = {"SINGLE": 0, "GRID": 1, "DIAG": 2, "LIST": 3, "ADAPTIVE": 4}
+POLARITY_PARAM = {"NEGATIVE": -1, "POSITIVE": 1}
+KEYS_ARRAY = ["SENSOR_BIAS", "X_LIST", "Y_LIST", "SAMPLE_SCALE",
+    "SAMPLE_OFFSET", "CHARGE_WINDOW", "CHANNELS", "TRIGGERS", "ROI_START",
+    "ROI_LENGTH"]
 
 def load(path):
     parser = configparser.ConfigParser()
@@ -211,10 +441,12 @@ def load(path):
         config = {}
         for k, param in parser[key].items():
             if k in KEYS_ARRAY:
-                config[k] = [int(i) for i in param[1:-1].split(",")]
+                config[k] = [number(i) for i in param[1:-1].split(",")
+                    if i.strip() != ""]
             elif param in BOOLEAN_PARAM.keys():
                 config[k] = BOOLEAN_PARAM[param]
-            elif param in MODE_PARAM.keys():
+            # Only MODE, WAIT_MODE = ADAPTIVE is a name of its own
+            elif k == "MODE" and param in MODE_PARAM.keys():
                 config[k] = MODE_PARAM[param]
             else:
                 try:
@@ -227,6 +459,12 @@ def load(path):
     config = {key: parse(key) for key in parser.sections()}
     return config
 
+def number(param):
+    try:
+        return int(param)
+    except ValueError:
+        return float(param)
+
 if __name__ == "__main__":
     print("I'm a module, please don't run me alone.")
     exit()
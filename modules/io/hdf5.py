@@ -0,0 +1,228 @@
+# HDF5 output through h5py, for when PyROOT isn't around or the data is to
+# be read with NumPy. Holds the same content as TreeFile, laid out as:
+# - w0..w15, trg0..1: one (events, samples) dataset per waveform, chunked
+#   and compressed. Dropped channels get none, suppressed waveforms are zeros
+# - mask (events), start (events, 18): as the wfm branches of the same name
+# - point (events): index of the point each event belongs to in points
+# - points: one record per point, POINT_BRANCHES fields
+# - features/<name> (events, 18): features.Reducer output, if asked for
+# - file attributes: frequency, length, sampleType, scale, offset and
+#   settings (JSON)
+# Whole decoded blocks are appended with one write per dataset.
+
+import numpy as np
+import os, json
+from ..features import FEATURES as FEATURE_NAMES
+from .writer import Writer, BRANCHES, NAMES, POINT_BRANCHES, BRANCH_ROWS, \
+    ALGORITHMS, asArray
+from .reader import Reader
+
+# Missing h5py is only a problem if we actually try to write HDF5
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# Events per chunk, unless set with autoFlush
+CHUNK_EVENTS = 256
+POINT_TYPES = {"D": np.float64, "L": np.int64}
+
+class Hdf5File(Writer):
+
+    # Same arguments as TreeFile. _compression_ (algorithm * 100 + level)
+    # maps to gzip at that level for ZLIB and to lzf, the fast filter that
+    # comes with h5py, for LZ4, ZSTD and LZMA. _autoFlush_ sets the events
+    # per chunk, _basketSize_ and _autoSave_ have no HDF5 counterpart.
+    # Without _lengths_ all waveforms are as long as the first block's.
+    def __init__(self, path, name, compression = 0, sampleType = "DOUBLE",
+        features = False, basketSize = 0, autoFlush = 0, autoSave = 0,
+        lengths = None):
+        if h5py == None:
+            raise ImportError("HDF5 output needs h5py")
+
+        Writer.__init__(self, sampleType, lengths)
+        path = os.path.join(path, "{}.h5".format(name))
+        self.file = h5py.File(path, "w-")
+
+        self.filter = {}
+        algorithm, level = divmod(compression, 100)
+        if algorithm == ALGORITHMS["ZLIB"]:
+            self.filter = {"compression": "gzip", "compression_opts": level}
+        elif algorithm != ALGORITHMS["NONE"]:
+            self.filter = {"compression": "lzf"}
+        self.chunk = autoFlush if autoFlush > 0 else CHUNK_EVENTS
+
+        self.waves = None
+        self.mask = self.dataset("mask", (), np.uint32)
+        self.start = self.dataset("start", (BRANCHES,), np.int16)
+        self.point = self.dataset("point", (), np.uint32)
+        self.points = self.file.create_dataset("points", (0,),
+            [(name, POINT_TYPES[leaf]) for name, leaf in POINT_BRANCHES],
+            maxshape = (None,), chunks = (64,))
+
+        self.summary = None
+        if features:
+            group = self.file.create_group("features")
+            self.summary = {name: self.dataset(name, (BRANCHES,), np.float32,
+                group) for name in FEATURE_NAMES}
+
+        self.bias = 0.0
+        self.pos = (0.0, 0.0)
+        self.length = 0
+
+        # Waveforms set one at a time with setChannel/setTrigger, see fill()
+        self.event = None
+        self.eventMask = 0
+
+    # Empty dataset that grows along the first axis, one _shape_ per event
+    def dataset(self, name, shape, dtype, group = None, compress = False):
+        group = self.file if group is None else group
+        return group.create_dataset(name, (0,) + shape, dtype,
+            maxshape = (None,) + shape, chunks = (self.chunk,) + shape,
+            **(self.filter if compress else {}))
+
+    # Waveform datasets, _length_ samples each unless set at creation
+    def createWaves(self, length):
+        lengths = self.lengths
+        if lengths is None:
+            lengths = np.full(BRANCHES, length)
+
+        self.waves = [self.dataset(name, (int(n),), self.dtype,
+            compress = True) if n > 0 else None
+            for name, n in zip(NAMES, lengths)]
+        self.event = [np.zeros(int(n), self.dtype) for n in lengths]
+
+    def fill(self):
+        if self.waves is None:
+            self.createWaves(self.length)
+
+        keep = (self.eventMask >> np.arange(BRANCHES)) & 1
+        self.append([wave[None] for wave in self.event], keep[None] == 1,
+            np.array([self.eventMask]), np.zeros((1, BRANCHES), np.int16))
+
+    # Same as TreeFile.fillBlock(), one write per dataset for the whole block
+    def fillBlock(self, samples, present, keep = None, lengths = None,
+        starts = None):
+        keep, masks, starts = self.select(samples, present, keep, starts)
+        if self.waves is None:
+            self.createWaves(samples.shape[2])
+
+        samples = self.encode(samples)
+        waves = [samples[:, row] for row in BRANCH_ROWS]
+        self.append(waves, keep, masks, starts)
+
+    def append(self, waves, keep, masks, starts):
+        events = len(masks)
+        for b, dataset in enumerate(self.waves):
+            if dataset is None:
+                continue
+            values = waves[b][:, :dataset.shape[1]].astype(self.dtype)
+            values[~keep[:, b]] = 0
+            extend(dataset, values)
+
+        extend(self.mask, masks)
+        extend(self.start, starts)
+        extend(self.point, np.full(events, self.pointIndex, np.uint32))
+
+    # Append the output of features.Reducer.reduce() for the block last
+    # passed to fillBlock()
+    def fillFeatures(self, features):
+        for name in FEATURE_NAMES:
+            extend(self.summary[name], features[name][:, BRANCH_ROWS])
+
+    # Close the current point, _stats_ as returned by Tracker.stats()
+    def fillPoint(self, stats):
+        point = np.zeros(1, self.points.dtype)
+        point["bias"] = self.bias
+        point["x"], point["y"] = self.pos
+        for name, value in stats.items():
+            point[name] = value
+        point["firstEntry"], point["lastEntry"] = \
+            self.closePoint(self.mask.shape[0])
+        extend(self.points, point)
+
+    def clearEvent(self):
+        if self.event is not None:
+            for wave in self.event:
+                wave[:] = 0
+        self.eventMask = 0
+
+    def write(self):
+        attributes = self.file.attrs
+        attributes["sampleType"] = self.sampleType
+        attributes["scale"] = self.scale
+        attributes["offset"] = self.offset
+        self.file.flush()
+
+    def close(self):
+        self.write()
+        self.file.close()
+
+    def setChannel(self, index, data, length):
+        self.setWave(index, data, length)
+
+    def setTrigger(self, index, data, length):
+        self.setWave(BRANCHES - 2 + index, data, length)
+
+    # Stage waveform _b_ of the next event, see fill()
+    def setWave(self, b, data, length):
+        if self.waves is None:
+            self.createWaves(self.length or length)
+
+        wave = self.event[b]
+        length = min(length, len(wave))
+        wave[:length] = self.encode(asArray(data, length), b)[:length]
+        wave[length:] = 0
+        if length > 0 and self.waves[b] is not None:
+            self.eventMask |= 1 << b
+        else:
+            self.eventMask &= ~(1 << b)
+
+    def setFrequency(self, frequency):
+        self.file.attrs["frequency"] = float(frequency)
+
+    def setEventLength(self, length):
+        self.length = int(length)
+        self.file.attrs["length"] = self.length
+
+    def setPosition(self, x, y):
+        self.pos = (float(x), float(y))
+
+    def setBias(self, bias):
+        self.bias = float(bias)
+
+    # Store _settings_, e.g. Config.asDict(), as JSON in the settings
+    # attribute
+    def setSettings(self, settings):
+        self.file.attrs["settings"] = json.dumps(settings)
+
+class Hdf5Reader(Reader):
+
+    def __init__(self, path):
+        if h5py == None:
+            raise ImportError("Reading HDF5 needs h5py")
+
+        self.file = h5py.File(path, "r")
+        points = self.file["points"][:]
+        Reader.__init__(self, [dict(zip(points.dtype.names, point.tolist()))
+            for point in points])
+
+    # All events of _point_ at once: a dict of arrays, one per dataset (w0,
+    # mask, start, point, features/amplitude...) with one row per event
+    def events(self, point):
+        start, stop = self.entries(point)
+        events = {}
+        def take(name, item):
+            if isinstance(item, h5py.Dataset) and name != "points":
+                events[name] = item[start:stop]
+        self.file.visititems(take)
+        return events
+
+    def close(self):
+        self.file.close()
+
+# Append _values_ to _dataset_ along its first axis
+def extend(dataset, values):
+    size = dataset.shape[0]
+    dataset.resize(size + len(values), axis = 0)
+    dataset[size:] = values
@@ -0,0 +1,104 @@
+# Progress journal of a scan, so that a run that crashed or was quit can be
+# picked up again with main.py --resume instead of starting over.
+#
+# {name}.journal holds one JSON record per line, each one flushed to disk
+# before moving on:
+# - {"part": name}: output file (or shard set) the following points went to.
+#   A resumed run writes to a new part, FILENAME_part1 and so on, the
+#   points already taken stay where they are
+# - {"bias", "x", "y", "events"}: point done, its data safely on disk. With
+#   MODE = ADAPTIVE also "merit", its figure of merit, so that a resumed run
+#   refines the same cells. A point can show up more than once, e.g. when
+#   more events are taken there at a finer ADAPTIVE grid, events add up and
+#   the merit of the latest record is that of all events so far
+# Points skipped or cut short never make it in, they are taken again.
+
+import json, os
+
+class Journal():
+
+    # Start a new journal for _name_ in _path_, or carry on with the one
+    # there if _resume_
+    def __init__(self, path, name, resume = False):
+        self.name = name
+        self.path = os.path.join(path, "{}.journal".format(name))
+        self.done = set()
+        self.merits = {}
+        self.events = {}
+        self.parts = 0
+
+        if resume:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError("Nothing to resume, {} is missing"
+                    .format(self.path))
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Half a line, the crash happened while writing it
+                        continue
+                    if "part" in record:
+                        self.parts += 1
+                    else:
+                        point = key(record["bias"], record["x"],
+                            record["y"])
+                        self.done.add(point)
+                        self.events[point] = self.events.get(point, 0) + \
+                            record["events"]
+                        if "merit" in record:
+                            self.merits[point] = record["merit"]
+
+        self.file = open(self.path, "a" if resume else "x")
+
+    # Name of the output file of this run and note it down
+    def startPart(self):
+        part = self.name
+        if self.parts > 0:
+            part = "{}_part{}".format(self.name, self.parts)
+        self.parts += 1
+        self.append({"part": part})
+        return part
+
+    def isDone(self, bias, x, y):
+        return key(bias, x, y) in self.done
+
+    # Events taken at a point so far, over all records of it
+    def taken(self, bias, x, y):
+        return self.events.get(key(bias, x, y), 0)
+
+    # Figure of merit noted down for a point done, None if there is none
+    def merit(self, bias, x, y):
+        return self.merits.get(key(bias, x, y))
+
+    # Call once the point is written to file. A _merit_ of more events
+    # taken at a point already done is combined with the one there, weighted
+    # by the events behind each.
+    def add(self, bias, x, y, events, merit = None):
+        before = self.taken(bias, x, y)
+        self.done.add(key(bias, x, y))
+        self.events[key(bias, x, y)] = before + int(events)
+        record = {"bias": float(bias), "x": float(x), "y": float(y),
+            "events": int(events)}
+        if merit is not None:
+            merit = [float(m) for m in merit]
+            previous = self.merit(bias, x, y)
+            total = before + int(events)
+            if previous != None and len(previous) == len(merit) and total > 0:
+                merit = [(p * before + m * int(events)) / total
+                    for p, m in zip(previous, merit)]
+            self.merits[key(bias, x, y)] = merit
+            record["merit"] = merit
+        self.append(record)
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+# Points are matched on rounded values, positions can be fractional in DIAG
+def key(bias, x, y):
+    return (round(float(bias), 6), round(float(x), 6), round(float(y), 6))
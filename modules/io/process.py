@@ -0,0 +1,174 @@
+# Output written by a separate process, so that filling and compressing the
+# file never compete with readout for the GIL. Decoded blocks go through a
+# ring of slots in shared memory instead of being pickled: the DAQ copies a
+# block into a free slot and sends its number over, the writer process fills
+# the file straight from the slot and hands it back. With no slot free the
+# DAQ waits for one (back-pressure). Everything else (features, point stats,
+# settings) is small and goes through the same command queue as is, so
+# calls reach the file in the order they were made.
+
+import multiprocessing as mp
+import numpy as np
+import queue, signal, traceback
+from multiprocessing import shared_memory
+from .writer import BRANCH_ROWS, TRIGGERS
+
+# Slots in the ring and events each of them holds, bigger blocks are split
+SLOTS = 4
+SLOT_EVENTS = 128
+# How often the DAQ checks on the writer process while waiting for a slot, s
+FREE_TIMEOUT = 0.5
+
+# Rows and groups of a decoded block, see Digitizer.decodeBlock()
+ROWS = len(BRANCH_ROWS)
+GROUPS = TRIGGERS
+
+# Writer methods passed on to the file as they are, anything else is an error
+# here rather than in the writer process
+FORWARDED = ["setFrequency", "setEventLength", "setScale", "setCorrection",
+    "setSettings", "setBias", "setPosition", "fillFeatures", "fillPoint"]
+
+class WriterProcess():
+
+    # _opener_ is called in the writer process and returns the file to write
+    # to, e.g. a functools.partial of writer.create(). _length_ is the
+    # longest record to expect, in samples.
+    def __init__(self, opener, length, slots = SLOTS,
+        slotEvents = SLOT_EVENTS):
+        self.slotEvents = slotEvents
+        slot = slotType(slotEvents, length)
+        self.memory = shared_memory.SharedMemory(create = True,
+            size = slot.itemsize * slots)
+        self.ring = np.ndarray(slots, slot, buffer = self.memory.buf)
+
+        # Forked, so the ring and _opener_ get to the writer process as they
+        # are. Spawning would import main.py again.
+        context = mp.get_context("fork")
+        self.commands = context.Queue()
+        self.free = context.Queue()
+        self.errors = context.Queue()
+        self.written = context.Queue()
+        for s in range(slots):
+            self.free.put(s)
+
+        self.process = context.Process(target = serve, args = (opener,
+            self.ring, self.commands, self.free, self.errors, self.written),
+            daemon = True)
+        self.process.start()
+        self.closed = False
+
+    # Setters, fillFeatures and fillPoint (FORWARDED) are passed on
+    def __getattr__(self, attr):
+        if attr not in FORWARDED:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                type(self).__name__, attr))
+        def call(*args):
+            self.send(attr, *args)
+        return call
+
+    def send(self, command, *args):
+        self.check()
+        self.commands.put((command, args))
+
+    # Same arguments as TreeFile.fillBlock()
+    def fillBlock(self, samples, present, keep = None, lengths = None,
+        starts = None):
+        n, rows, width = samples.shape
+        for first in range(0, n, self.slotEvents):
+            last = min(first + self.slotEvents, n)
+            count = last - first
+            slot = self.take()
+
+            view = self.ring[slot]
+            view["samples"][:count, :rows, :width] = samples[first:last]
+            view["present"][:count] = present[first:last]
+            if keep is not None:
+                view["keep"][:count] = keep[first:last]
+            if starts is not None:
+                view["starts"][:count] = starts[first:last]
+            if lengths is not None:
+                view["lengths"][:] = lengths
+
+            self.send("block", slot, count, rows, width, keep is not None,
+                lengths is not None, starts is not None)
+
+    # Unlike everything else, waits for the file to be written: whatever was
+    # sent before is on disk on return
+    def write(self):
+        self.send("write")
+        while True:
+            try:
+                return self.written.get(timeout = FREE_TIMEOUT)
+            except queue.Empty:
+                self.check()
+
+    # Wait for a free slot
+    def take(self):
+        while True:
+            try:
+                return self.free.get(timeout = FREE_TIMEOUT)
+            except queue.Empty:
+                self.check()
+
+    # Raise whatever went wrong in the writer process
+    def check(self):
+        if not self.errors.empty():
+            raise RuntimeError("Writer process failed:\n{}".format(
+                self.errors.get()))
+        if not self.process.is_alive():
+            raise RuntimeError("Writer process died, exit code {}".format(
+                self.process.exitcode))
+
+    # Wait for the writer process to go through everything sent so far,
+    # close the file and stop
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            self.send("close")
+            self.process.join()
+            if not self.errors.empty():
+                raise RuntimeError("Writer process failed:\n{}".format(
+                    self.errors.get()))
+        finally:
+            del self.ring
+            self.memory.close()
+            self.memory.unlink()
+
+# Layout of a slot holding _events_ events of up to _length_ samples
+def slotType(events, length):
+    return np.dtype([("samples", np.float32, (events, ROWS, length)),
+        ("present", np.uint32, (events, GROUPS)),
+        ("keep", bool, (events, ROWS)),
+        ("starts", np.int16, (events, ROWS)),
+        ("lengths", np.int64, (ROWS,))])
+
+# Writer process: open the file and go through commands until told to close
+def serve(opener, ring, commands, free, errors, written):
+    # Ctrl-C is for the DAQ, which then closes the file through us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        file = opener()
+        while True:
+            command, args = commands.get()
+            if command == "block":
+                slot, count, rows, width, keep, lengths, starts = args
+                view = ring[slot]
+                file.fillBlock(view["samples"][:count, :rows, :width],
+                    view["present"][:count],
+                    view["keep"][:count, :rows] if keep else None,
+                    view["lengths"][:rows] if lengths else None,
+                    view["starts"][:count, :rows] if starts else None)
+                free.put(slot)
+            elif command == "write":
+                file.write()
+                written.put(True)
+            elif command == "close":
+                file.close()
+                return
+            else:
+                getattr(file, command)(*args)
+    except Exception:
+        errors.put(traceback.format_exc())
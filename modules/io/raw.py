@@ -0,0 +1,137 @@
+import struct, os, time
+
+# File layout: one file header, then any number of frames, each one a frame
+# header followed by _size_ bytes straight out of a readout buffer.
+FILE_MAGIC = b"UFSDRAW"
+FILE_VERSION = 2
+# magic, version, then by version:
+# 1: sampling frequency (MHz), record length
+# 2: same plus flags (FLAG_*)
+FILE_START = struct.Struct("<7sB")
+FILE_HEADERS = {1: struct.Struct("<7sBdI"), 2: struct.Struct("<7sBdII")}
+
+# The board applied its DRS4 corrections (USE_INTERNAL_CORRECTION) to the
+# samples. They are not in the raw data, converting can't apply them.
+FLAG_CORRECTED = 0x1
+
+FRAME_MAGIC = b"FRM0"
+# magic, bias (V), x, y (um), unix time (s), payload size (bytes), events,
+# and from version 2 on the index of the point the frame belongs to
+FRAME_HEADERS = {1: struct.Struct("<4sddddII"),
+    2: struct.Struct("<4sddddIII")}
+
+class RawFile():
+
+    def __init__(self, path, name):
+        path = os.path.join(path, "{}.raw".format(name))
+
+        # Unbuffered, frames are big enough already
+        self.file = open(path, "xb", buffering = 0)
+        self.headerWritten = False
+
+        self.frequency = 0.0
+        self.length = 0
+        self.bias = 0.0
+        self.pos = (0.0, 0.0)
+        self.flags = 0
+        # Points closed so far, frames carry it to tell points apart
+        self.point = 0
+
+    # Written with the first block, once frequency and length are set, or
+    # at the latest on write(), so that a file with no events is still valid
+    def writeHeader(self):
+        if not self.headerWritten:
+            self.file.write(FILE_HEADERS[FILE_VERSION].pack(FILE_MAGIC,
+                FILE_VERSION, self.frequency, self.length, self.flags))
+            self.headerWritten = True
+
+    # Append a raw block transfer holding _events_ events
+    def writeBlock(self, data, events):
+        self.writeHeader()
+        self.file.write(FRAME_HEADERS[FILE_VERSION].pack(FRAME_MAGIC,
+            self.bias, self.pos[0], self.pos[1], time.time(), len(data),
+            events, self.point))
+        self.file.write(data)
+
+    # Only the point index moves on: event headers within frames are all it
+    # takes to work out point stats again when converting, as convert.py does
+    def fillPoint(self, stats):
+        self.point += 1
+
+    def write(self):
+        self.writeHeader()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.write()
+        self.file.close()
+
+    def setFrequency(self, frequency):
+        self.frequency = float(frequency)
+
+    def setEventLength(self, length):
+        self.length = int(length)
+
+    def setPosition(self, x, y):
+        self.pos = (float(x), float(y))
+
+    def setBias(self, bias):
+        self.bias = float(bias)
+
+    # Whether the board corrects samples itself, see FLAG_CORRECTED
+    def setCorrection(self, enabled):
+        if enabled:
+            self.flags |= FLAG_CORRECTED
+        else:
+            self.flags &= ~FLAG_CORRECTED
+
+    # Settings aren't part of the format, give them to convert.py instead
+    def setSettings(self, settings):
+        pass
+
+# Read the file header and all frame headers in _path_. Returns the file
+# header as (frequency, length, flags) and a list of frames as
+# (offset of the payload, bias, x, y, time, size, events, point). Version 1
+# files have no flags (None) and no point index, points are told apart by a
+# change of bias or position instead.
+def scan(path):
+    frames = []
+    total = os.path.getsize(path)
+    with open(path, "rb") as file:
+        start = file.read(FILE_START.size)
+        if len(start) < FILE_START.size:
+            raise ValueError("{} is not a raw UFSDPyDAQ file".format(path))
+        magic, version = FILE_START.unpack(start)
+        if magic != FILE_MAGIC or version not in FILE_HEADERS:
+            raise ValueError("{} is not a raw UFSDPyDAQ file".format(path))
+
+        header = FILE_HEADERS[version]
+        fields = header.unpack(start + file.read(header.size - len(start)))
+        frequency, length = fields[2:4]
+        flags = fields[4] if version > 1 else None
+
+        frameHeader = FRAME_HEADERS[version]
+        point, last = -1, None
+        while True:
+            header = file.read(frameHeader.size)
+            if len(header) < frameHeader.size:
+                break
+
+            fields = frameHeader.unpack(header)
+            magic, bias, x, y, t, size, events = fields[:7]
+            if magic != FRAME_MAGIC:
+                raise ValueError("Corrupted frame at byte {}".format(
+                    file.tell() - frameHeader.size))
+
+            # Last frame was cut short, e.g. by a crash
+            if file.tell() + size > total:
+                break
+
+            if version > 1:
+                point = fields[7]
+            elif (bias, x, y) != last:
+                point, last = point + 1, (bias, x, y)
+            frames.append((file.tell(), bias, x, y, t, size, events, point))
+            file.seek(size, os.SEEK_CUR)
+
+    return (frequency, length, flags), frames
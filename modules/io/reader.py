@@ -0,0 +1,97 @@
+# Reading output files back one point at a time. Every point records the
+# range of events taken there (firstEntry, lastEntry in the points table),
+# so getting to the events of a given bias and position doesn't take going
+# through the whole file.
+#
+#   file = io.reader.read("run.root")
+#   for point in file.find(bias = 200, x = 100):
+#       start, stop = file.entries(point)
+#
+# Sharded output (SHARD_POINTS, convert.py) is read through its manifest,
+# read("run.json"): points of all shards in one table, each one telling its
+# shard, events() going to the right file. Entry ranges are within the shard.
+# To spread shards over a process pool instead, shardFiles("run.json") lists
+# them and each worker reads its own.
+
+import importlib, os
+from .writer import FORMATS
+from .shards import readManifest
+
+# Readers of each format, module and class
+READERS = {"ROOT": ("tree", "TreeReader"), "HDF5": ("hdf5", "Hdf5Reader")}
+
+# Open the ROOT or HDF5 file at _path_, the format is told by the extension,
+# or the shards listed by the manifest at _path_ (.json)
+def read(path):
+    extension = os.path.splitext(path)[1][1:]
+    if extension == "json":
+        return ShardedReader(path)
+    for format, (module, cls, ext) in FORMATS.items():
+        if ext == extension and format in READERS:
+            module, cls = READERS[format]
+            module = importlib.import_module("." + module, __package__)
+            return getattr(module, cls)(path)
+    raise ValueError("Can't read {}".format(path))
+
+# Files of the shards listed by the manifest at _path_, in order
+def shardFiles(path):
+    return [shard["file"] for shard in readManifest(path)["shards"]]
+
+# Base class of the readers, all about the points table. Backends provide
+# events(point) and close().
+class Reader():
+
+    # _points_ is the points table, a list of dicts with the POINT_BRANCHES
+    # names as keys, in the order points were taken
+    def __init__(self, points):
+        self.points = points
+
+    # Points taken at _bias_ (V) and (_x_, _y_) (um), within _tolerance_.
+    # Any bias or position if left out.
+    def find(self, bias = None, x = None, y = None, tolerance = 1E-6):
+        wanted = [(key, value) for key, value in
+            [("bias", bias), ("x", x), ("y", y)] if value != None]
+        return [point for point in self.points
+            if all(abs(point[key] - value) <= tolerance
+                for key, value in wanted)]
+
+    # Entry range of _point_ as (start, stop), stop excluded, e.g. for
+    # slicing or RDataFrame.Range()
+    def entries(self, point):
+        return int(point["firstEntry"]), int(point["lastEntry"]) + 1
+
+# All shards of a manifest as one file. Points also have the index of their
+# shard ("shard") and the file it is ("file"). Only one shard is open at a
+# time, going through points in order opens each of them once.
+class ShardedReader(Reader):
+
+    def __init__(self, path):
+        self.files = shardFiles(path)
+        self.reader = None
+        self.current = None
+
+        points = []
+        for shard in range(len(self.files)):
+            for point in self.open(shard).points:
+                point["shard"] = shard
+                point["file"] = self.files[shard]
+                points.append(point)
+        Reader.__init__(self, points)
+
+    # Reader of shard _index_, closing the one open before
+    def open(self, index):
+        if index != self.current:
+            self.close()
+            self.reader = read(self.files[index])
+            self.current = index
+        return self.reader
+
+    # As events() of the shard's own reader
+    def events(self, point):
+        return self.open(point["shard"]).events(point)
+
+    def close(self):
+        if self.reader != None:
+            self.reader.close()
+            self.reader = None
+            self.current = None
@@ -0,0 +1,140 @@
+# Output split over several files, one every _points_ points, plus a JSON
+# manifest listing what each of them holds. Shards are independent files of
+# the chosen format, so analysis can hand them out to a process pool, and a
+# crash only costs the shard being written.
+#
+# Manifest ({name}.json, next to the shards):
+# {"name", "format", "frequency", "length", "shardPoints",
+#  "shards": [{"file", "events", "bytes", "opened", "closed",
+#              "points": [{"bias", "x", "y", "events"}, ...]}, ...]}
+# It is rewritten, atomically, every time a shard is closed: shards listed
+# there are complete. convert.py writes the same manifest, with shardPoints
+# 0 as its shards hold as many points as it takes to balance the work.
+
+import json, os, time
+from . import writer
+
+class ShardedFile():
+
+    # _format_ and _options_ as taken by writer.create()
+    def __init__(self, path, name, points, format, **options):
+        self.path = path
+        self.name = name
+        self.points = points
+        self.format = format
+        self.options = options
+        self.extension = writer.FORMATS[format][2]
+
+        self.manifest = {"name": name, "format": format, "frequency": 0.0,
+            "length": 0, "shardPoints": points, "shards": []}
+        self.manifestPath = os.path.join(path, "{}.json".format(name))
+        if os.path.exists(self.manifestPath):
+            raise FileExistsError(self.manifestPath)
+
+        # Setter calls made so far, replayed on every new shard
+        self.calls = {}
+        self.file = None
+        self.shard = None
+        self.bias = 0.0
+        self.pos = (0.0, 0.0)
+
+    # Current shard, opened on first use so that there is never an empty one
+    def current(self):
+        if self.file == None:
+            index = len(self.manifest["shards"])
+            name = "{}_{:04d}".format(self.name, index)
+            self.file = writer.create(self.format, self.path, name,
+                **self.options)
+            for method, args in self.calls.items():
+                getattr(self.file, method)(*args)
+            self.shard = {"file": "{}.{}".format(name, self.extension),
+                "events": 0, "bytes": 0, "opened": time.time(), "closed": 0,
+                "points": []}
+        return self.file
+
+    # fillBlock, fillFeatures, writeBlock and the like go to the current shard
+    def __getattr__(self, attr):
+        return getattr(self.current(), attr)
+
+    def set(self, method, *args):
+        self.calls[method] = args
+        if self.file != None:
+            getattr(self.file, method)(*args)
+
+    def setFrequency(self, frequency):
+        self.manifest["frequency"] = float(frequency)
+        self.set("setFrequency", frequency)
+
+    def setEventLength(self, length):
+        self.manifest["length"] = int(length)
+        self.set("setEventLength", length)
+
+    def setScale(self, scales, offsets):
+        self.set("setScale", scales, offsets)
+
+    def setSettings(self, settings):
+        self.set("setSettings", settings)
+
+    def setPosition(self, x, y):
+        self.pos = (float(x), float(y))
+        self.set("setPosition", x, y)
+
+    def setBias(self, bias):
+        self.bias = float(bias)
+        self.set("setBias", bias)
+
+    def setCorrection(self, enabled):
+        self.set("setCorrection", enabled)
+
+    # Close the current point, the shard too once it has enough of them
+    def fillPoint(self, stats):
+        self.current().fillPoint(stats)
+        events = int(stats["events"])
+        self.shard["points"].append({"bias": self.bias, "x": self.pos[0],
+            "y": self.pos[1], "events": events})
+        self.shard["events"] += events
+
+        if len(self.shard["points"]) >= self.points:
+            self.closeShard()
+
+    def write(self):
+        if self.file != None:
+            self.file.write()
+
+    def close(self):
+        if self.file != None:
+            self.closeShard()
+        self.writeManifest()
+
+    def closeShard(self):
+        self.file.close()
+        self.shard["bytes"] = os.path.getsize(os.path.join(self.path,
+            self.shard["file"]))
+        self.shard["closed"] = time.time()
+        self.manifest["shards"].append(self.shard)
+        self.file = None
+        self.shard = None
+        self.writeManifest()
+
+    def writeManifest(self):
+        writeManifest(self.manifestPath, self.manifest)
+
+# Write _manifest_ to _path_, through a temporary file so that a crash never
+# leaves half a manifest
+def writeManifest(path, manifest):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(manifest, file, indent = 2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+# Read the manifest at _path_, shard file names made absolute
+def readManifest(path):
+    with open(path) as file:
+        manifest = json.load(file)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    for shard in manifest["shards"]:
+        shard["file"] = os.path.join(directory, shard["file"])
+    return manifest
@@ -1,46 +1,195 @@
 import ROOT as rt
+import numpy as np
+from ..features import FEATURES as FEATURE_NAMES
+from .writer import Writer, CHANNELS, BRANCHES, NAMES, POINT_BRANCHES, \
+    SAMPLE_TYPES, BRANCH_ROWS, asArray
+from .reader import Reader
 from array import array
-import os, math
+import os, math, json
 
 MAX_FILE_SIZE = 500 # GB
 
-class TreeFile():
+# TTree leaf types of the POINT_BRANCHES types, as array typecodes
+LEAF_TYPES = {"D": "d", "L": "q"}
 
-    def __init__(self, path, name, compression = 0):
+class TreeFile(Writer):
+
+    # _compression_ as returned by writer.compressionSetting(). _basketSize_
+    # (bytes) applies to every wfm branch, _autoFlush_ and _autoSave_ go to
+    # TTree.SetAutoFlush/SetAutoSave: entries if positive, bytes if negative.
+    # 0 leaves any of them to ROOT. With _lengths_ (samples, one value or one
+    # per decoded block row) waveforms go to fixed-size array branches, e.g.
+    # w0[1024]/F, rows of length 0 get no branch at all. Without, they go to
+    # std::vector branches.
+    def __init__(self, path, name, compression = 0, sampleType = "DOUBLE",
+        features = False, basketSize = 0, autoFlush = 0, autoSave = 0,
+        lengths = None):
+        Writer.__init__(self, sampleType, lengths)
+        vectorType, dtype, leafType = SAMPLE_TYPES[sampleType]
         path = os.path.join(path, "{}.root".format(name))
 
         self.file = rt.TFile(path, "CREATE", name, compression)
         self.tree = rt.TTree("wfm", "Digitizer waveforms")
         self.tree.SetMaxTreeSize(math.floor(MAX_FILE_SIZE * 10E9))
 
-        self.bias = array("d", [0.0])
-        self.tree.Branch("bias", self.bias, "bias/D")
+        # Entry in pts of the point the event was taken at, bias and
+        # position are stored there once per point
+        self.pointId = array("I", [0])
+        self.tree.Branch("point", self.pointId, "point/i")
+        self.bias = 0.0
+        self.pos = (0.0, 0.0)
 
-        self.frequency = array("d", [0.0])
-        self.tree.Branch("freq", self.frequency, "freq/D")
+        waves = []
+        if self.lengths is None:
+            for name in NAMES:
+                wave = rt.std.vector(vectorType)()
+                self.tree.Branch(name, wave)
+                waves.append(wave)
+        else:
+            # All arrays are views of one buffer, so that an event goes in
+            # with a single copy
+            ends = np.cumsum(self.lengths)
+            self.buffer = np.zeros(ends[-1], self.dtype)
+            for name, end, length in zip(NAMES, ends, self.lengths):
+                if length == 0:
+                    waves.append(None)
+                    continue
+                wave = self.buffer[end - length:end]
+                self.tree.Branch(name, wave, "{}[{}]/{}".format(name,
+                    length, leafType))
+                waves.append(wave)
+
+            # Branch, block row and sample each element of the buffer comes
+            # from
+            self.packBranch = np.repeat(np.arange(BRANCHES), self.lengths)
+            self.packRow = np.asarray(BRANCH_ROWS)[self.packBranch]
+            self.packSample = np.arange(ends[-1]) - \
+                np.repeat(ends - self.lengths, self.lengths)
+
+        self.channels = waves[:CHANNELS]
+        self.triggers = waves[CHANNELS:]
 
-        self.length = array("d", [0.0])
-        self.tree.Branch("size", self.length, "size/D")
+        # Bit n set if the nth waveform (w0..w15, trg0..1) holds samples
+        self.mask = array("I", [0])
+        self.tree.Branch("mask", self.mask, "mask/i")
 
-        self.pos = rt.std.vector("double")()
-        self.tree.Branch("pos", self.pos)
+        # Sample of the record each waveform starts at, see features.Window
+        self.start = np.zeros(BRANCHES, np.int16)
+        self.tree.Branch("start", self.start, "start[{}]/S".format(BRANCHES))
 
-        self.channels = []
-        for c in range(16):
-            wave = rt.std.vector("double")()
-            self.tree.Branch("w{}".format(c), wave)
-            self.channels.append(wave)
+        if basketSize > 0:
+            self.tree.SetBasketSize("*", basketSize)
+        if autoFlush != 0:
+            self.tree.SetAutoFlush(autoFlush)
+        if autoSave != 0:
+            self.tree.SetAutoSave(autoSave)
+
+        # One entry per point, tells whether the DAQ kept up
+        self.points = rt.TTree("pts", "Per-point acquisition stats")
+        self.point = {}
+        for name, leaf in POINT_BRANCHES:
+            self.point[name] = array(LEAF_TYPES[leaf], [0])
+            self.points.Branch(name, self.point[name],
+                "{}/{}".format(name, leaf))
+
+        # One entry per run: sampling frequency (MHz), record length and
+        # sample = stored * scale + offset, per branch in w0..w15, trg0..1
+        # order, see Writer.setScale(). The full configuration goes to the
+        # settings object, see setSettings().
+        self.run = rt.TTree("run", "Run settings")
+        self.frequency = array("d", [0.0])
+        self.run.Branch("frequency", self.frequency, "frequency/D")
+        self.length = array("I", [0])
+        self.run.Branch("length", self.length, "length/i")
+        self.run.Branch("scale", self.scale, "scale[{}]/D".format(BRANCHES))
+        self.run.Branch("offset", self.offset, "offset[{}]/D".format(BRANCHES))
 
-        self.triggers = []
-        for t in range(2):
-            wave = rt.std.vector("double")()
-            self.tree.Branch("trg{}".format(t), wave)
-            self.triggers.append(wave)
+        # Optional per-event summary, see features.Reducer. One entry per
+        # wfm entry so it can be read as a friend, one value per branch in
+        # w0..w15, trg0..1 order.
+        self.summary = None
+        if features:
+            self.summary = rt.TTree("ftr", "Per-event waveform features")
+            self.feature = {}
+            for name in FEATURE_NAMES:
+                self.feature[name] = np.zeros(BRANCHES, np.float32)
+                self.summary.Branch(name, self.feature[name],
+                    "{}[{}]/F".format(name, BRANCHES))
 
     def fill(self):
         self.tree.Fill()
 
+    # Fill a whole decoded block, as returned by Digitizer.decodeBlock().
+    # _samples_ has shape (events, groups * 9, length) with the group's TR0
+    # copy in the last row of each group, _present_ has shape
+    # (events, groups) and tells which groups were read out. _keep_, as
+    # returned by features.Selector.select(), leaves out more waveforms.
+    # Waveforms left out are stored empty and have their mask bit cleared.
+    # _lengths_ and _starts_, as returned by features.Window.apply() along
+    # with windowed samples, give the length of each row and where it
+    # starts in the record.
+    def fillBlock(self, samples, present, keep = None, lengths = None,
+        starts = None):
+        keep, masks, starts = self.select(samples, present, keep, starts)
+        if self.lengths is not None:
+            self.fillArrays(samples, keep, masks, starts)
+            return
+
+        if lengths is None:
+            lengths = np.full(samples.shape[1], samples.shape[2])
+        lengths = lengths[BRANCH_ROWS]
+
+        samples = self.encode(samples)
+        waves = self.channels + self.triggers
+        for i in range(len(samples)):
+            for b, row in enumerate(BRANCH_ROWS):
+                # Clear instead of repeating old samples
+                fillVector(waves[b], samples[i, row],
+                    lengths[b] if keep[i, b] else 0)
+            self.mask[0] = int(masks[i])
+            self.start[:] = starts[i]
+
+            self.fill()
+
+    # fillBlock() for fixed-size arrays: the block is packed into the layout
+    # of the array buffer in one go, then copied over one event at a time.
+    # Waveforms left out are zeroed.
+    def fillArrays(self, samples, keep, masks, starts):
+        packed = self.encode(samples)[:, self.packRow, self.packSample]
+        packed[~keep[:, self.packBranch]] = 0
+        for i in range(len(packed)):
+            self.buffer[:] = packed[i]
+            self.mask[0] = int(masks[i])
+            self.start[:] = starts[i]
+
+            self.fill()
+
+    # Fill the summary tree with the output of features.Reducer.reduce() for
+    # the block last passed to fillBlock()
+    def fillFeatures(self, features):
+        values = {name: features[name][:, BRANCH_ROWS]
+            for name in FEATURE_NAMES}
+        for i in range(len(values[FEATURE_NAMES[0]])):
+            for name in FEATURE_NAMES:
+                self.feature[name][:] = values[name][i]
+            self.summary.Fill()
+
+    # Close the current point, _stats_ as returned by Tracker.stats()
+    def fillPoint(self, stats):
+        self.point["bias"][0] = self.bias
+        self.point["x"][0], self.point["y"][0] = self.pos
+        for name, value in stats.items():
+            self.point[name][0] = value
+        self.point["firstEntry"][0], self.point["lastEntry"][0] = \
+            self.closePoint(self.tree.GetEntries())
+        self.points.Fill()
+        self.pointId[0] = self.pointIndex
+
     def clearEvent(self):
+        if self.lengths is not None:
+            self.buffer[:] = 0
+            return
+
         for c in self.channels:
             c.clear()
 
@@ -49,39 +198,93 @@ class TreeFile():
 
     def clearMeta(self):
         self.length[0] = 0
-        self.bias[0] = 0
+        self.bias = 0.0
         self.frequency[0] = 0
-        self.pos.clear()
+        self.pos = (0.0, 0.0)
 
+    # Save everything written so far, replacing the previous copy of each tree
+    # instead of piling up a new key cycle per call, and make sure it is on
+    # disk: a file cut short after this reads back up to here
     def write(self):
-        self.file.Write()
+        if self.run.GetEntries() == 0:
+            self.run.Fill()
+        self.file.Write("", rt.TObject.kOverwrite)
+        self.file.Flush()
 
     def close(self):
-        self.file.Write()
+        self.write()
         self.file.Close()
 
+    # _data_ can either be a POINTER(c_float) straight from a decoded Group
+    # or a NumPy array, samples are copied in bulk in both cases.
     def setChannel(self, index, data, length):
-        channel = self.channels[index]
-        channel.clear()
-        for w in range(length):
-            channel.push_back(float(data[w]))
+        data = self.encode(asArray(data, length), index)
+        fillWave(self.channels[index], data, length)
 
     def setTrigger(self, index, data, length):
-        trigger = self.triggers[index]
-        trigger.clear()
-        for t in range(length):
-            trigger.push_back(float(data[t]))
+        data = self.encode(asArray(data, length), CHANNELS + index)
+        fillWave(self.triggers[index], data, length)
 
     def setFrequency(self, frequency):
         self.frequency[0] = float(frequency)
 
     def setEventLength(self, length):
-        self.length[0] = float(length)
+        self.length[0] = int(length)
 
     def setPosition(self, x, y):
-        self.pos.clear()
-        self.pos.push_back(float(x))
-        self.pos.push_back(float(y))
+        self.pos = (float(x), float(y))
 
     def setBias(self, bias):
-        self.bias[0] = float(bias)
+        self.bias = float(bias)
+
+    # Store _settings_, e.g. Config.asDict(), as JSON in the title of the
+    # settings object
+    def setSettings(self, settings):
+        self.file.WriteTObject(rt.TNamed("settings", json.dumps(settings)),
+            "settings", "Overwrite")
+
+class TreeReader(Reader):
+
+    def __init__(self, path):
+        self.file = rt.TFile.Open(path)
+        self.tree = self.file.Get("wfm")
+
+        points = self.file.Get("pts")
+        if not points.GetBranch("firstEntry"):
+            raise ValueError("{} has no entry ranges, it was written by an "
+                "older version".format(path))
+        Reader.__init__(self, [{name: getattr(point, name)
+            for name, leaf in POINT_BRANCHES} for point in points])
+
+    # Go through the events of _point_: the wfm tree is returned with each
+    # entry loaded in turn
+    def events(self, point):
+        for i in range(*self.entries(point)):
+            self.tree.GetEntry(i)
+            yield self.tree
+
+    def close(self):
+        self.file.Close()
+
+# Copy _length_ samples from _data_ into a fixed-size array branch, zeroing
+# what's left, or into a vector branch. Arrays of dropped channels are None.
+def fillWave(wave, data, length):
+    if wave is None:
+        return
+    if not isinstance(wave, np.ndarray):
+        fillVector(wave, data, length)
+        return
+
+    length = min(length, len(wave))
+    wave[:length] = data[:length]
+    wave[length:] = 0
+
+# Copy _length_ samples from _data_ into _vector_ without looping in Python:
+# the vector is resized once and its storage is then filled through a NumPy
+# view in a single assignment, casting to the vector's type if needed.
+def fillVector(vector, data, length):
+    vector.resize(length)
+    if length == 0:
+        return
+
+    np.asarray(vector)[:] = asArray(data, length)[:length]
@@ -0,0 +1,158 @@
+# What every output file does, whatever the format, and how to open one.
+# Backends other than RAW are only imported when asked for, so that e.g.
+# HDF5 output works on a machine without PyROOT.
+
+import numpy as np
+import importlib
+
+# Output formats, the module and class implementing each of them and the
+# file extension
+FORMATS = {"ROOT": ("tree", "TreeFile", "root"),
+    "HDF5": ("hdf5", "Hdf5File", "h5"), "RAW": ("raw", "RawFile", "raw")}
+
+# Waveforms: 16 channels plus one TR0 copy per digitizer group
+CHANNELS = 16
+TRIGGERS = 2
+BRANCHES = CHANNELS + TRIGGERS
+NAMES = ["w{}".format(c) for c in range(CHANNELS)] + \
+    ["trg{}".format(t) for t in range(TRIGGERS)]
+
+# Per-point values and their types (D: double, L: 64 bit integer). bias, x
+# and y as requested, stats from readout.Tracker, then xStage and yStage as
+# read back from the stage, biasMon (V) and currentMon (uA) as read back from
+# the sensor channel, 0 when not under our control. firstEntry and lastEntry
+# are the range of events taken at the point (lastEntry < firstEntry if
+# none), startTime and stopTime unix times, see io.reader to make use of them.
+POINT_BRANCHES = [("bias", "D"), ("x", "D"), ("y", "D"),
+    ("events", "L"), ("triggers", "L"), ("lost", "L"),
+    ("duration", "D"), ("triggerRate", "D"), ("eventRate", "D"),
+    ("xStage", "D"), ("yStage", "D"), ("biasMon", "D"), ("currentMon", "D"),
+    ("firstEntry", "L"), ("lastEntry", "L"), ("startTime", "D"),
+    ("stopTime", "D")]
+
+# On-disk sample types: C++ type of the waveform vectors, matching dtype and
+# leaf type for fixed-size arrays. SHORT stores round((sample - offset) /
+# scale), see Writer.setScale()
+SAMPLE_TYPES = {"DOUBLE": ("double", np.float64, "D"),
+    "FLOAT": ("float", np.float32, "F"), "SHORT": ("short", np.int16, "S")}
+SHORT_RANGE = (-32768, 32767)
+
+# Compression algorithms, the setting is algorithm * 100 + level as in TFile
+ALGORITHMS = {"NONE": 0, "ZLIB": 1, "LZMA": 2, "LZ4": 4, "ZSTD": 5}
+
+# Rows of a decoded block (see Digitizer.decodeBlock) holding w0..w15 and
+# trg0..1, in branch order. Each group has 8 channels and its TR0 copy.
+GROUP_SIZE = CHANNELS // TRIGGERS
+BRANCH_ROWS = ([g * (GROUP_SIZE + 1) + c for g in range(TRIGGERS)
+    for c in range(GROUP_SIZE)] +
+    [g * (GROUP_SIZE + 1) + GROUP_SIZE for g in range(TRIGGERS)])
+MASK_BITS = np.arange(BRANCHES, dtype = np.uint32)
+
+# Open a new output file in _format_ (see FORMATS) called _name_ in _path_.
+# _options_ go to the backend, see TreeFile and Hdf5File. RAW takes none.
+def create(format, path, name, **options):
+    if format not in FORMATS:
+        raise ValueError("Unknown output format {}".format(format))
+
+    module, cls, extension = FORMATS[format]
+    module = importlib.import_module("." + module, __package__)
+    if format == "RAW":
+        options = {}
+    return getattr(module, cls)(path, name, **options)
+
+# Base class of the backends that store decoded events: sample types and
+# scaling, and which waveforms of a block get stored. Backends implement the
+# rest, with the same methods TreeFile always had:
+# setBias, setPosition, setFrequency, setEventLength, setChannel, setTrigger,
+# fill, fillBlock, fillFeatures, fillPoint, clearEvent, write and close.
+class Writer():
+
+    # _lengths_ as taken by TreeFile, kept here in branch order
+    def __init__(self, sampleType, lengths = None):
+        if sampleType not in SAMPLE_TYPES:
+            raise ValueError("Unknown sample type {}".format(sampleType))
+        self.sampleType = sampleType
+        self.dtype = SAMPLE_TYPES[sampleType][1]
+
+        self.lengths = None
+        if lengths is not None:
+            self.lengths = np.broadcast_to(np.asarray(lengths, int),
+                (len(BRANCH_ROWS),))[BRANCH_ROWS]
+
+        # sample = stored * scale + offset, per branch. Only SHORT uses
+        # anything but 1 and 0
+        self.scale = np.ones(BRANCHES)
+        self.offset = np.zeros(BRANCHES)
+        self.rowScale = np.ones((len(BRANCH_ROWS), 1), np.float32)
+        self.rowOffset = np.zeros((len(BRANCH_ROWS), 1), np.float32)
+
+        # Point being acquired, its index and first entry
+        self.pointIndex = 0
+        self.firstEntry = 0
+
+    # Convert decoded samples to the on-disk type in one go. _samples_ is a
+    # whole block, or a single waveform when _branch_ is given (0..15 for
+    # channels, 16 and 17 for triggers).
+    def encode(self, samples, branch = None):
+        if self.sampleType != "SHORT":
+            return samples
+
+        if branch == None:
+            scale, offset = self.rowScale, self.rowOffset
+        else:
+            scale, offset = self.scale[branch], self.offset[branch]
+        values = np.rint((samples - offset) / scale)
+        return np.clip(values, *SHORT_RANGE).astype(np.int16)
+
+    # Per-branch scale and offset for SHORT samples, one value each or one
+    # per branch (w0..w15, trg0..1). Must be set before the first write().
+    def setScale(self, scales, offsets):
+        if self.sampleType != "SHORT":
+            return
+
+        scales = np.broadcast_to(np.asarray(scales, np.float64), BRANCHES)
+        offsets = np.broadcast_to(np.asarray(offsets, np.float64), BRANCHES)
+        if np.any(scales <= 0):
+            raise ValueError("Sample scales have to be positive")
+
+        self.scale[:] = scales
+        self.offset[:] = offsets
+        self.rowScale[BRANCH_ROWS, 0] = scales
+        self.rowOffset[BRANCH_ROWS, 0] = offsets
+
+    # Work out, in branch order, which waveforms of a block get stored, the
+    # mask word of each event and where each waveform starts. Arguments as
+    # taken by fillBlock().
+    def select(self, samples, present, keep = None, starts = None):
+        if keep is None:
+            keep = np.repeat(present == 1, GROUP_SIZE + 1, axis = 1)
+        keep = keep[:, BRANCH_ROWS]
+        if self.lengths is not None:
+            keep = keep & (self.lengths > 0)
+        masks = (keep.astype(np.uint32) << MASK_BITS).sum(axis = 1)
+
+        if starts is None:
+            starts = np.zeros(samples.shape[:2], np.int16)
+        return keep, masks, starts[:, BRANCH_ROWS]
+
+    # Move on to the next point, returns the entry range (first, last) of the
+    # one being closed, _entries_ being the number of events written so far
+    def closePoint(self, entries):
+        first, self.firstEntry = self.firstEntry, entries
+        self.pointIndex += 1
+        return first, entries - 1
+
+# TFile compression setting for _algorithm_ (see ALGORITHMS) and _level_
+def compressionSetting(algorithm, level):
+    if algorithm not in ALGORITHMS:
+        raise ValueError("Unknown compression algorithm {}".format(algorithm))
+    if ALGORITHMS[algorithm] == 0:
+        return 0
+    return ALGORITHMS[algorithm] * 100 + level
+
+# Wrap a ctypes pointer to _length_ samples as a NumPy array (no copy, only
+# valid until the digitizer decodes the next event)
+def asArray(data, length):
+    if isinstance(data, np.ndarray) or length == 0:
+        return data
+    return np.ctypeslib.as_array(data, shape = (length,))
@@ -0,0 +1,286 @@
+# Threaded readout engine: one thread keeps draining the digitizer into a
+# pool of readout buffers while another one decodes and writes full blocks,
+# so the board never waits for ROOT to fill and compress.
+
+import threading, queue, time
+import numpy as np
+
+from .digitizer import TIME_TAG_PERIOD, COUNTER_BITS, TIME_TAG_BITS
+
+# Number of readout buffers cycled between reader and writer
+BUFFERS = 2
+# How long the reader waits for a free buffer before giving up on the
+# current block, in seconds
+FREE_TIMEOUT = 0.5
+# How long the writer waits for a full buffer before checking again
+# whether the reader is still alive, in seconds
+FULL_TIMEOUT = 0.1
+
+# Ways of waiting for events between block transfers:
+# POLL:     no waiting, read back to back
+# ADAPTIVE: sleep based on the measured trigger rate
+# IRQ:      wait for the board's interrupt (optical link only)
+WAIT_MODES = ["POLL", "ADAPTIVE", "IRQ"]
+# ADAPTIVE: aim for blocks of this many events, a quarter of what the
+# board can hold, but never sleep longer than MAX_DELAY seconds
+FILL_EVENTS = 32
+MAX_DELAY = 0.05
+# ADAPTIVE: first sleep after an empty block, doubled at every empty block
+MIN_DELAY = 0.001
+# ADAPTIVE: blocks this big mean we are not keeping up, stop sleeping
+FULL_EVENTS = 64
+# ADAPTIVE: weight of the last block in the trigger rate average
+SMOOTHING = 0.2
+# IRQ: events that raise the interrupt, and how long to wait for it (ms)
+IRQ_EVENTS = 1
+IRQ_TIMEOUT = 100
+
+class Readout():
+
+    # _consumer_ is called from the writer thread as
+    # consumer(buffer, taken, target) and returns the number of events
+    # it took from _buffer_
+    def __init__(self, digitizer, consumer, buffers = BUFFERS,
+        waiter = None):
+        self.dgt = digitizer
+        self.consumer = consumer
+        self.waiter = waiter if waiter != None else Waiter(digitizer, "POLL")
+
+        # Buffers go around in a loop: empty -> reader -> full -> writer.
+        # Once every buffer is waiting to be written the empty pool runs
+        # dry and the reader has to wait for one, draining the board in the
+        # meantime (back-pressure, see drain()).
+        self.buffers = [self.dgt.newBuffer() for i in range(max(buffers, 2))]
+        self.empty = queue.Queue()
+        self.full = queue.Queue()
+        for buffer in self.buffers:
+            self.empty.put(buffer)
+
+        # If the writer falls too far behind the board is drained into this
+        # one and its content is thrown away
+        self.scratch = self.dgt.newBuffer()
+
+        self.resetCounters()
+
+    def resetCounters(self):
+        # Non-empty blocks read from the digitizer
+        self.blocks = 0
+        # Blocks (and events within) thrown away because no buffer was free
+        self.dropped = 0
+        self.droppedEvents = 0
+
+    # Read and write _target_ events, blocking until done. Returns the
+    # number of events written.
+    def run(self, target):
+        self.taken = 0
+        self.error = None
+        self.done = threading.Event()
+
+        reader = threading.Thread(target = self.read, daemon = True)
+        writer = threading.Thread(target = self.write, args = (target,),
+            daemon = True)
+        reader.start()
+        writer.start()
+
+        writer.join()
+        self.done.set()
+        # Whatever is left over belongs to this point, discard it. This also
+        # wakes the reader up if it was waiting for a free buffer.
+        self.recycle()
+        reader.join()
+        self.recycle()
+
+        if self.error != None:
+            raise self.error
+        return self.taken
+
+    # Reader thread: keep transferring blocks from the digitizer
+    def read(self):
+        try:
+            while not self.done.is_set():
+                try:
+                    buffer = self.empty.get(timeout = FREE_TIMEOUT)
+                except queue.Empty:
+                    if not self.done.is_set():
+                        self.drain()
+                    continue
+
+                self.waiter.wait()
+                self.dgt.readData(buffer)
+                if buffer.size.value == 0:
+                    self.waiter.update(0)
+                    self.empty.put(buffer)
+                    continue
+
+                self.waiter.update(self.dgt.getNumEvents(buffer))
+                self.blocks += 1
+                self.full.put(buffer)
+        except Exception as e:
+            self.error = e
+            self.done.set()
+
+    # Writer thread: decode and write full blocks until _target_ is reached
+    def write(self, target):
+        try:
+            while self.taken < target and not self.done.is_set():
+                try:
+                    buffer = self.full.get(timeout = FULL_TIMEOUT)
+                except queue.Empty:
+                    continue
+
+                self.taken += self.consumer(buffer, self.taken, target)
+                self.empty.put(buffer)
+        except Exception as e:
+            self.error = e
+            self.done.set()
+
+    # Move all full buffers back to the empty queue without writing them
+    def recycle(self):
+        while not self.full.empty():
+            self.empty.put(self.full.get())
+
+    # Empty the board's memory into the scratch buffer, so that it can keep
+    # triggering, and count what got lost
+    def drain(self):
+        self.dgt.readData(self.scratch)
+        if self.scratch.size.value == 0:
+            return
+
+        self.dropped += 1
+        self.droppedEvents += self.dgt.getNumEvents(self.scratch)
+
+    # Free all readout buffers
+    def release(self):
+        for buffer in self.buffers + [self.scratch]:
+            self.dgt.freeBuffer(buffer)
+
+# Decides how long to wait before each block transfer, so that low trigger
+# rates don't turn into a busy loop of empty USB transfers
+class Waiter():
+
+    def __init__(self, digitizer, mode = "ADAPTIVE"):
+        if mode not in WAIT_MODES:
+            raise ValueError("Unknown wait mode {}".format(mode))
+
+        self.dgt = digitizer
+        self.mode = mode
+        if mode == "IRQ":
+            self.dgt.setInterruptConfig(1, IRQ_EVENTS)
+        self.reset()
+
+    # Forget about the past, call before starting a new acquisition
+    def reset(self):
+        self.delay = 0.0
+        # Trigger rate estimate, Hz
+        self.rate = 0.0
+        self.last = time.perf_counter()
+
+    # Call right before reading from the digitizer
+    def wait(self):
+        if self.mode == "IRQ":
+            self.dgt.irqWait(IRQ_TIMEOUT)
+        elif self.delay > 0:
+            time.sleep(self.delay)
+
+    # Call right after reading, with the number of events that came in
+    def update(self, events):
+        now = time.perf_counter()
+        elapsed, self.last = now - self.last, now
+        if self.mode != "ADAPTIVE":
+            return
+
+        # Nothing yet, back off exponentially
+        if events == 0:
+            self.delay = min(max(self.delay * 2, MIN_DELAY), MAX_DELAY)
+            return
+
+        rate = events / max(elapsed, 1E-6)
+        if self.rate == 0:
+            self.rate = rate
+        else:
+            self.rate += SMOOTHING * (rate - self.rate)
+
+        # Either we're falling behind, or we sleep just enough for a
+        # decent block to pile up on the board
+        if events >= FULL_EVENTS:
+            self.delay = 0.0
+        else:
+            self.delay = min(FILL_EVENTS / self.rate, MAX_DELAY)
+
+# Keeps track of EventCounter and TriggerTimeTag over the events of a point,
+# to tell how many triggers came in, how many of them were lost (board full
+# or blocks dropped by the readout) and the actual trigger rate.
+class Tracker():
+
+    def __init__(self):
+        self.reset()
+
+    # Call at the start of each point. _when_ (unix time) defaults to now,
+    # as it does in update()
+    def reset(self, when = None):
+        self.startTime = time.time() if when == None else when
+        self.stopTime = self.startTime
+        self.events = 0
+        self.triggers = 0
+        # Trigger time tag ticks between the first and the last event
+        self.ticks = 0
+        self.lastCounter = None
+        self.lastTag = None
+
+    # Account for a block of events, _info_ as returned by decodeBlock()
+    def update(self, info, when = None):
+        if len(info) == 0:
+            return
+        self.stopTime = time.time() if when == None else when
+
+        counters = info["EventCounter"].astype(np.int64)
+        tags = info["TriggerTimeTag"].astype(np.int64)
+        if self.lastCounter == None:
+            # The first event counts as one trigger and starts the clock
+            self.triggers = 1
+            self.lastCounter = counters[0]
+            self.lastTag = tags[0]
+
+        self.triggers += int(steps(counters, self.lastCounter,
+            COUNTER_BITS).sum())
+        self.ticks += int(steps(tags, self.lastTag, TIME_TAG_BITS).sum())
+        self.events += len(info)
+        self.lastCounter = counters[-1]
+        self.lastTag = tags[-1]
+
+    # Triggers that never made it to file
+    @property
+    def lost(self):
+        return self.triggers - self.events
+
+    @property
+    def duration(self):
+        return self.ticks * TIME_TAG_PERIOD
+
+    # Triggers and recorded events per second
+    @property
+    def triggerRate(self):
+        return (self.triggers - 1) / self.duration if self.ticks > 0 else 0.0
+
+    @property
+    def eventRate(self):
+        return (self.events - 1) / self.duration if self.ticks > 0 else 0.0
+
+    # Everything above, as stored in the output file
+    def stats(self):
+        return {"events": self.events, "triggers": self.triggers,
+            "lost": self.lost, "duration": self.duration,
+            "triggerRate": self.triggerRate, "eventRate": self.eventRate,
+            "startTime": self.startTime, "stopTime": self.stopTime}
+
+# Increments between consecutive _values_ of a _bits_ wide counter that
+# rolls over, starting from _last_
+def steps(values, last, bits):
+    previous = np.concatenate(([last], values[:-1]))
+    return (values - previous) % (1 << bits)
+
+if __name__ == "__main__":
+    print("I'm a module, please don't run me alone.")
+    exit()
+else:
+    print("[Readout ok] ", end = "")
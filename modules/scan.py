@@ -0,0 +1,203 @@
+# Order in which scan points are visited, to keep stage travel short: GRID
+# goes back and forth (serpentine) instead of flying back to Y_START after
+# every column, any other set of points (LIST) is ordered nearest neighbour
+# first and then improved with 2-opt. Points are (x, y) in um.
+# Also which points to visit at all in MODE = ADAPTIVE, see Refiner.
+
+import numpy as np
+from .stage import CONVERSION_COEFFICIENT
+from .digitizer import GROUP_CHANNELS
+
+# Time lost at every move whatever its length (acceleration, settling,
+# controller round trips), s
+MOVE_OVERHEAD = 0.5
+# 2-opt gives up after this many passes over the whole path
+TWO_OPT_PASSES = 50
+
+# Grid points column by column, every other column walked backwards
+def serpentine(xs, ys):
+    ys = list(ys)
+    return [(x, y) for i, x in enumerate(xs)
+        for y in (ys if i % 2 == 0 else ys[::-1])]
+
+# Shortest (in stage time) order of _points_ we can find quickly, starting
+# from _start_ if given or else from the first point. _speed_ and
+# _concurrent_ as for moveTimes().
+def order(points, start = None, speed = 1, concurrent = False):
+    if len(points) < 3:
+        return list(points)
+
+    xy = np.asarray(points, float)
+    origin = xy[0] if start == None else np.asarray(start, float)
+    path = nearestNeighbour(xy, origin, speed, concurrent)
+    path = twoOpt(xy, path, origin, speed, concurrent)
+    return [points[i] for i in path]
+
+# Indices of _xy_ (n, 2) visited always going to the closest point left
+def nearestNeighbour(xy, origin, speed, concurrent):
+    left = np.ones(len(xy), bool)
+    path = []
+    current = origin
+    for i in range(len(xy)):
+        times = moveTimes(current, xy, speed, concurrent)
+        times[~left] = np.inf
+        following = int(times.argmin())
+        path.append(following)
+        left[following] = False
+        current = xy[following]
+    return path
+
+# Improve _path_ (indices of _xy_, an open path leaving from _origin_) by
+# reversing stretches of it for as long as that makes it shorter
+def twoOpt(xy, path, origin, speed, concurrent):
+    path = np.asarray(path)
+    for p in range(TWO_OPT_PASSES):
+        improved = False
+        for i in range(len(path) - 1):
+            # Reverse path[i:j + 1] for the best j: edges (before i, i) and
+            # (j, after j) become (before i, j) and (i, after j). The last
+            # point has nothing after it.
+            walk = xy[path]
+            before = origin if i == 0 else walk[i - 1]
+            ends = walk[i + 1:]
+            after = walk[i + 2:]
+            old = moveTimes(before, walk[i], speed, concurrent) + \
+                np.append(moveTimes(ends[:-1], after, speed, concurrent), 0)
+            new = moveTimes(before, ends, speed, concurrent) + \
+                np.append(moveTimes(walk[i], after, speed, concurrent), 0)
+            gain = old - new
+            j = int(gain.argmax())
+            if gain[j] > 1E-9:
+                path[i:i + j + 2] = path[i:i + j + 2][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return path.tolist()
+
+# Time it takes to move from _a_ to _b_ (either can be many points), s.
+# _speed_ is the stage speed in steps/min, axes move one after the other
+# unless _concurrent_.
+def moveTimes(a, b, speed, concurrent = False):
+    delta = np.abs(np.asarray(b, float) - np.asarray(a, float))
+    length = delta.max(axis = -1) if concurrent else delta.sum(axis = -1)
+    return MOVE_OVERHEAD + length / (speed * CONVERSION_COEFFICIENT / 60)
+
+# Straight line length of the path through _points_ from _start_, um, and
+# the time the stage takes to go through it, s
+def travel(points, start = None, speed = 1, concurrent = False):
+    if len(points) == 0:
+        return 0.0, 0.0
+    xy = np.asarray(points, float)
+    origin = xy[:1] if start == None else np.asarray([start], float)
+    walk = np.concatenate([origin, xy])
+    distance = np.hypot(*(walk[1:] - walk[:-1]).T).sum()
+    time = moveTimes(walk[:-1], walk[1:], speed, concurrent).sum()
+    return float(distance), float(time)
+
+# Figure of merit of a point for MODE = ADAPTIVE: mean pulse amplitude of
+# every channel kept, over the events taken there
+class Merit():
+
+    # _rows_ is a boolean array of the decoded block rows to look at, see
+    # features.Selector.rows
+    def __init__(self, rows):
+        self.rows = np.asarray(rows, bool)
+        self.reset()
+
+    def reset(self):
+        self.sum = np.zeros(self.rows.sum())
+        self.count = np.zeros(self.rows.sum())
+
+    # Account for a block: _amplitude_ (events, rows) as from
+    # features.amplitudes() or Reducer.reduce(), _present_ (events, groups)
+    def add(self, amplitude, present):
+        rows = amplitude.shape[1]
+        taken = np.repeat(present != 0, GROUP_CHANNELS, axis = 1)[:, :rows]
+        taken = taken[:, self.rows[:rows]]
+        self.sum += np.where(taken, amplitude[:, self.rows[:rows]], 0).sum(0)
+        self.count += taken.sum(0)
+
+    def value(self):
+        return self.sum / np.maximum(self.count, 1)
+
+# MODE = ADAPTIVE: a grid from (xStart, yStart) to (xEnd, yEnd), first with
+# steps 2 ** _levels_ times xStep and yStep, then halving them only within
+# cells where the figure of merit (see Merit) changes between corners by
+# more than _threshold_, as a fraction of the largest value seen on the
+# first grid. Pad edges and gaps get the full resolution, flat areas don't.
+# Points are kept as indices on the finest grid. Cells along the far edges
+# can be narrower, so that xEnd and yEnd are always in.
+class Refiner():
+
+    def __init__(self, xStart, xStep, xEnd, yStart, yStep, yEnd, levels,
+        threshold):
+        self.origin = (xStart, yStart)
+        self.steps = (xStep, yStep)
+        self.last = ((xEnd - xStart) // xStep, (yEnd - yStart) // yStep)
+        self.size = 2 ** levels
+        self.threshold = threshold
+        self.merits = {}
+        self.scale = None
+
+        # Cells as (i, j) of their lower corner
+        self.cells = [(i, j)
+            for i in range(0, max(self.last[0], 1), self.size)
+            for j in range(0, max(self.last[1], 1), self.size)]
+
+    # Points of the first, coarse grid
+    def start(self):
+        return self.positions(sorted(set(corner for cell in self.cells
+            for corner in self.corners(cell))))
+
+    # Take the _merits_ of the points last returned, as {(x, y): value}
+    # (points skipped can be left out), and return the points of the next
+    # grid, none once at the finest one. These include the points already
+    # taken on coarser grids that are corners of the new cells.
+    def refine(self, merits):
+        for (x, y), merit in merits.items():
+            self.merits[self.index(x, y)] = np.asarray(merit, float)
+        if self.scale is None and len(self.merits) > 0:
+            self.scale = np.maximum(np.abs(list(self.merits.values()))
+                .max(axis = 0), 1E-9)
+        if self.size == 1 or self.scale is None:
+            return []
+
+        split = [cell for cell in self.cells if self.change(cell) >
+            self.threshold]
+        self.size //= 2
+        self.cells = [(i + di, j + dj) for i, j in split
+            for di in [0, self.size] for dj in [0, self.size]
+            if (di == 0 or i + di < self.last[0]) and
+                (dj == 0 or j + dj < self.last[1])]
+        return self.positions(sorted(set(corner for cell in self.cells
+            for corner in self.corners(cell))))
+
+    # Largest relative change of the merit between corners of _cell_
+    def change(self, cell):
+        values = [self.merits[c] for c in self.corners(cell)
+            if c in self.merits]
+        if len(values) < 2:
+            return 0
+        return ((np.max(values, axis = 0) - np.min(values, axis = 0)) /
+            self.scale).max()
+
+    # Corners of _cell_, those past the end of the grid moved back onto it
+    def corners(self, cell):
+        i, j = cell
+        return sorted(set((min(i + di, self.last[0]),
+            min(j + dj, self.last[1]))
+            for di in [0, self.size] for dj in [0, self.size]))
+
+    def positions(self, indices):
+        return [(self.origin[0] + i * self.steps[0],
+            self.origin[1] + j * self.steps[1]) for i, j in indices]
+
+    def index(self, x, y):
+        return (int(round((x - self.origin[0]) / self.steps[0])),
+            int(round((y - self.origin[1]) / self.steps[1])))
+
+if __name__ == "__main__":
+    print("I'm a module, please don't run me alone.")
+    exit()
+else:
+    print("[Scan ok] ", end = "")
@@ -0,0 +1,410 @@
+# Simulated DT5742, stands in for libCAENDigitizer.so when no board is around.
+# Implements the CAEN_DGTZ_* calls used by the Digitizer class, taking and
+# filling the same ctypes objects, and produces X742 block transfers with
+# LGAD-like pulses, noise and a digitized TR0 on both groups.
+
+from ctypes import *
+import numpy as np
+import time
+
+from . import x742
+from .digitizer import Event, GROUPS, GROUP_CHANNELS, MAX_RECORD_LENGTH, \
+    TIME_TAG_PERIOD, ERROR_TIMEOUT, ACQUISITION_CONTROL, COUNT_ALL_TRIGGERS
+
+# Mean trigger rate, Hz
+RATE = 1000
+# Pulse amplitude scale and noise RMS, ADC counts
+AMPLITUDE = 400
+NOISE = 2
+# Fraction of channels that see a pulse in each event
+OCCUPANCY = 0.25
+# Channel baseline, ADC counts. Pulses are negative going.
+BASELINE = 3000
+# Pulse rise and fall time constants, ns
+RISE_TIME = 0.4
+FALL_TIME = 1.5
+# Delay between the TR0 edge and the sensor pulses, ns
+PULSE_DELAY = 5
+# TR0 copy: NIM-like negative pulse, amplitude in ADC counts, length in ns
+TRIGGER_AMPLITUDE = 1500
+TRIGGER_WIDTH = 20
+
+# Events the board can hold before it starts rejecting triggers
+BOARD_EVENTS = 128
+
+# Sampling periods for the DRS4 frequency settings, ns
+SAMPLING_PERIODS = [0.2, 0.4, 1, 1 / 0.75]
+
+# Registers we need to answer to, besides the acquisition control one
+STATUS_REGISTER = 0x8104
+# Status bits of a happy, ready and PLL-locked board
+STATUS_OK = 0x180
+# CAEN_DGTZ_GenericError
+ERROR_GENERIC = -2
+# How often IRQWait checks for new events, in seconds
+IRQ_POLL_INTERVAL = 0.001
+
+class SimulatedAPI():
+
+    def __init__(self, rate = RATE, amplitude = AMPLITUDE, noise = NOISE,
+        occupancy = OCCUPANCY, seed = None):
+        self.rate = rate
+        self.amplitude = amplitude
+        self.noise = noise
+        self.occupancy = occupancy
+        self.random = np.random.default_rng(seed)
+
+        self.registers = {STATUS_REGISTER: STATUS_OK}
+        self.recordLength = MAX_RECORD_LENGTH
+        self.maxEventsBLT = 1
+        self.groupMask = 0b11
+        self.digitized = 0
+        self.frequency = 0
+        self.postTrigger = 50
+        self.dcOffsets = {}
+
+        self.running = False
+        self.irqEvents = 0
+        # Triggers seen so far and events waiting in the board's memory,
+        # as (counter, time) pairs
+        self.triggers = 0
+        self.pending = []
+        self.clock = 0
+
+        # Keep allocated memory alive, keyed by address
+        self.memory = {}
+        # Event offsets in the last block transfer of each buffer
+        self.offsets = {}
+
+# ============================= BOARD COMMUNICATION ===========================
+
+    def CAEN_DGTZ_OpenDigitizer(self, link, number, conet, address, handle):
+        store(handle, 1)
+        return 0
+
+    def CAEN_DGTZ_CloseDigitizer(self, handle):
+        return 0
+
+    def CAEN_DGTZ_Reset(self, handle):
+        self.registers = {STATUS_REGISTER: STATUS_OK}
+        return 0
+
+    def CAEN_DGTZ_WriteRegister(self, handle, address, data):
+        self.registers[value(address)] = value(data)
+        return 0
+
+    def CAEN_DGTZ_ReadRegister(self, handle, address, data):
+        store(data, self.registers.get(value(address), 0))
+        return 0
+
+    def CAEN_DGTZ_SetAcquisitionMode(self, handle, mode):
+        return 0
+
+    def CAEN_DGTZ_GetInfo(self, handle, info):
+        info = target(info)
+        info.ModelName = b"DT5742"
+        info.Model = 5742
+        info.Channels = 16
+        info.ADC_NBits = 12
+        info.SerialNumber = 0
+        return 0
+
+    def CAEN_DGTZ_AllocateEvent(self, handle, event):
+        allocated = Event()
+        for g in range(GROUPS):
+            for c in range(GROUP_CHANNELS):
+                samples = (c_float * MAX_RECORD_LENGTH)()
+                self.memory[addressof(samples)] = samples
+                allocated.DataGroup[g].DataChannel[c] = cast(samples,
+                    POINTER(c_float))
+        self.memory[addressof(allocated)] = allocated
+
+        cast(event, POINTER(c_void_p))[0] = addressof(allocated)
+        return 0
+
+    def CAEN_DGTZ_MallocReadoutBuffer(self, handle, buffer, size):
+        length = x742.HEADER_WORDS + GROUPS * x742.groupWords(
+            MAX_RECORD_LENGTH)
+        allocated = (c_char * (length * 4 * max(self.maxEventsBLT, 1)))()
+        self.memory[addressof(allocated)] = allocated
+
+        cast(buffer, POINTER(c_void_p))[0] = addressof(allocated)
+        store(size, sizeof(allocated))
+        return 0
+
+    def CAEN_DGTZ_FreeEvent(self, handle, event):
+        address = cast(event, POINTER(c_void_p))[0]
+        allocated = self.memory.pop(address, None)
+        if allocated != None:
+            for g in range(GROUPS):
+                for c in range(GROUP_CHANNELS):
+                    pointer = allocated.DataGroup[g].DataChannel[c]
+                    self.memory.pop(cast(pointer, c_void_p).value, None)
+        return 0
+
+    def CAEN_DGTZ_FreeReadoutBuffer(self, buffer):
+        address = cast(buffer, POINTER(c_void_p))[0]
+        self.memory.pop(address, None)
+        return 0
+
+    def CAEN_DGTZ_SetMaxNumEventsBLT(self, handle, setting):
+        self.maxEventsBLT = value(setting)
+        return 0
+
+# ============================== TRIGGER SETTINGS =============================
+
+    def CAEN_DGTZ_SetFastTriggerMode(self, handle, mode):
+        return 0
+
+    def CAEN_DGTZ_SetFastTriggerDigitizing(self, handle, setting):
+        self.digitized = value(setting)
+        return 0
+
+    def CAEN_DGTZ_SetGroupFastTriggerDCOffset(self, handle, group, offset):
+        return 0
+
+    def CAEN_DGTZ_SetGroupFastTriggerThreshold(self, handle, group, threshold):
+        return 0
+
+    def CAEN_DGTZ_SetPostTriggerSize(self, handle, size):
+        self.postTrigger = value(size)
+        return 0
+
+    def CAEN_DGTZ_SetRecordLength(self, handle, length):
+        self.recordLength = value(length)
+        return 0
+
+    def CAEN_DGTZ_SetExtTriggerInputMode(self, handle, mode):
+        return 0
+
+    def CAEN_DGTZ_SetTriggerPolarity(self, handle, group, polarity):
+        return 0
+
+# ============================== DATA CAPTURE =================================
+
+    def CAEN_DGTZ_SendSWtrigger(self, handle):
+        self.accept(self.clock)
+        return 0
+
+    def CAEN_DGTZ_SetDRS4SamplingFrequency(self, handle, frequency):
+        self.frequency = value(frequency)
+        return 0
+
+    def CAEN_DGTZ_SetGroupEnableMask(self, handle, mask):
+        self.groupMask = value(mask)
+        return 0
+
+    def CAEN_DGTZ_SetChannelDCOffset(self, handle, channel, offset):
+        self.dcOffsets[value(channel)] = value(offset)
+        return 0
+
+    def CAEN_DGTZ_GetChannelDCOffset(self, handle, channel, offset):
+        store(offset, self.dcOffsets.get(value(channel), 0))
+        return 0
+
+    # Starting clears the board's memory and counters
+    def CAEN_DGTZ_SWStartAcquisition(self, handle):
+        self.running = True
+        self.started = time.perf_counter()
+        self.clock = 0
+        self.triggers = 0
+        self.pending = []
+        return 0
+
+    def CAEN_DGTZ_SWStopAcquisition(self, handle):
+        self.running = False
+        return 0
+
+    def CAEN_DGTZ_ReadData(self, handle, mode, buffer, size):
+        if self.running:
+            self.trigger()
+
+        events = self.pending[:self.maxEventsBLT]
+        self.pending = self.pending[len(events):]
+
+        data = b""
+        if len(events) > 0:
+            data = self.generate(events)
+        address = cast(buffer, c_void_p).value
+        memmove(address, data, len(data))
+
+        self.offsets[address] = None
+        store(size, len(data))
+        return 0
+
+    def CAEN_DGTZ_GetNumEvents(self, handle, buffer, size, number):
+        store(number, len(self.eventOffsets(buffer, size)))
+        return 0
+
+    def CAEN_DGTZ_GetEventInfo(self, handle, buffer, size, index, info,
+        event):
+        offset = self.eventOffsets(buffer, size)[value(index)]
+        address = cast(buffer, c_void_p).value + offset
+
+        header = np.ctypeslib.as_array(cast(address, POINTER(c_uint32)),
+            shape = (x742.HEADER_WORDS,))
+        info = target(info)
+        info.EventSize = int(header[0] & 0x0FFFFFFF) * 4
+        info.BoardId = int(header[1] >> 27)
+        info.Pattern = int((header[1] >> 8) & 0xFFFF)
+        info.ChannelMask = int(header[1] & 0xF)
+        info.EventCounter = int(header[2] & 0xFFFFFF)
+        info.TriggerTimeTag = int(header[3])
+
+        cast(event, POINTER(c_void_p))[0] = address
+        return 0
+
+    def CAEN_DGTZ_DecodeEvent(self, handle, event, decoded):
+        address = cast(event, c_void_p).value
+        size = (c_uint32.from_address(address).value & 0x0FFFFFFF) * 4
+        samples, info, groups = x742.decode(string_at(address, size))
+
+        output = Event.from_address(cast(decoded, POINTER(c_void_p))[0])
+        for g in range(GROUPS):
+            output.GrPresent[g] = groups[0, g]["GrPresent"]
+            if output.GrPresent[g] != 1:
+                continue
+
+            group = output.DataGroup[g]
+            group.TriggerTimeLag = int(groups[0, g]["TriggerTimeLag"])
+            group.StartIndexCell = int(groups[0, g]["StartIndexCell"])
+            for c in range(GROUP_CHANNELS):
+                length = int(groups[0, g]["ChSize"][c])
+                group.ChSize[c] = length
+                memmove(group.DataChannel[c],
+                    samples[0, g * GROUP_CHANNELS + c].ctypes.data,
+                    length * sizeof(c_float))
+        return 0
+
+    def CAEN_DGTZ_SetInterruptConfig(self, handle, state, level, statusID,
+        events, mode):
+        self.irqEvents = value(events) if value(state) else 0
+        return 0
+
+    # Wait for the interrupt condition, checking every millisecond
+    def CAEN_DGTZ_IRQWait(self, handle, timeout):
+        if self.irqEvents == 0:
+            return ERROR_GENERIC
+
+        deadline = time.perf_counter() + value(timeout) / 1000
+        while time.perf_counter() < deadline:
+            if self.running:
+                self.trigger()
+            if len(self.pending) >= self.irqEvents:
+                return 0
+            time.sleep(IRQ_POLL_INTERVAL)
+        return ERROR_TIMEOUT
+
+    def CAEN_DGTZ_LoadDRS4CorrectionData(self, handle, frequency):
+        return 0
+
+    def CAEN_DGTZ_EnableDRS4Correction(self, handle):
+        return 0
+
+# ============================== SIMULATION ===================================
+
+    # Draw the triggers that came in since the last call, from a Poisson
+    # process at the configured rate, and store what the board can hold
+    def trigger(self):
+        now = time.perf_counter() - self.started
+        count = self.random.poisson(self.rate * max(now - self.clock, 0))
+        self.clock, start = now, self.clock
+
+        # Only the first ones fit in the board's memory
+        accepted = min(count, BOARD_EVENTS - len(self.pending))
+        times = np.sort(self.random.uniform(start, now, accepted))
+        counters = self.triggers + np.arange(accepted)
+        self.pending += list(zip(counters.tolist(), times.tolist()))
+        self.triggers += accepted
+
+        if self.registers.get(ACQUISITION_CONTROL, 0) & COUNT_ALL_TRIGGERS:
+            self.triggers += count - accepted
+
+    def accept(self, t):
+        countAll = self.registers.get(ACQUISITION_CONTROL, 0) & \
+            COUNT_ALL_TRIGGERS
+        if len(self.pending) >= BOARD_EVENTS:
+            # Board is full, trigger is rejected
+            if countAll:
+                self.triggers += 1
+            return
+
+        self.pending.append((self.triggers, t))
+        self.triggers += 1
+
+    # Make up a block transfer for the (counter, time) pairs in _events_
+    def generate(self, events):
+        n = len(events)
+        length = self.recordLength
+        period = SAMPLING_PERIODS[self.frequency]
+        t = np.arange(length) * period
+
+        samples = BASELINE + self.noise * self.random.standard_normal(
+            (n, GROUPS * GROUP_CHANNELS, length), np.float32)
+
+        # TR0 edge sits where the post trigger setting puts it
+        edge = length * (1 - self.postTrigger / 100) * period
+        edges = edge + self.random.normal(0, period, (n, 1))
+        trigger = TRIGGER_AMPLITUDE * (sigmoid(t - edges, period) -
+            sigmoid(t - edges - TRIGGER_WIDTH, period))
+        for g in range(GROUPS):
+            samples[:, g * GROUP_CHANNELS + 8] -= trigger
+
+        # Sensor pulses on a random subset of channels, Landau-ish amplitudes
+        hit = self.random.random((n, GROUPS, GROUP_CHANNELS - 1)) < \
+            self.occupancy
+        amplitude = self.amplitude * self.random.gamma(4, 0.25, hit.shape)
+        start = edges[:, :, None] + PULSE_DELAY + \
+            self.random.normal(0, 0.05, hit.shape)
+        for g in range(GROUPS):
+            for c in range(GROUP_CHANNELS - 1):
+                dt = np.clip(t - start[:, g, c, None], 0, None)
+                shape = np.exp(-dt / FALL_TIME) - np.exp(-dt / RISE_TIME)
+                samples[:, g * GROUP_CHANNELS + c] -= (hit[:, g, c] *
+                    amplitude[:, g, c])[:, None] * shape / PULSE_PEAK
+
+        samples = np.clip(np.rint(samples), 0, 4095).astype(np.uint16)
+
+        counters = [e[0] for e in events]
+        timeTags = [int(e[1] / TIME_TAG_PERIOD) for e in events]
+        cells = self.random.integers(0, 1024, (n, GROUPS))
+        lags = self.random.integers(0, 1024, (n, GROUPS))
+        return x742.encode(samples, counters, timeTags, cells, lags,
+            self.groupMask, self.digitized)
+
+    # Find where each event starts in _buffer_, once per block transfer
+    def eventOffsets(self, buffer, size):
+        address = cast(buffer, c_void_p).value
+        offsets = self.offsets.get(address)
+        if offsets == None:
+            data = string_at(address, value(size))
+            words = np.frombuffer(data, np.uint32)
+            offsets, position = [], 0
+            while position < len(words):
+                offsets.append(position * 4)
+                position += int(words[position] & 0x0FFFFFFF)
+            self.offsets[address] = offsets
+        return offsets
+
+# Peak of exp(-t/FALL_TIME) - exp(-t/RISE_TIME), to normalise pulses
+PULSE_PEAK = max(np.exp(-t / FALL_TIME) - np.exp(-t / RISE_TIME)
+    for t in np.linspace(0, 5 * FALL_TIME, 10000))
+
+def sigmoid(t, width):
+    return 1 / (1 + np.exp(-t / width))
+
+# Arguments can come in as ctypes objects, byref() wrappers or plain values
+def value(arg):
+    return getattr(arg, "value", arg)
+
+def target(arg):
+    return getattr(arg, "_obj", arg)
+
+def store(arg, data):
+    target(arg).value = data
+
+if __name__ == "__main__":
+    print("I'm a module, please don't run me alone.")
+    exit()
+else:
+    print("[Simulator ok] ", end = "")
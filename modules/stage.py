@@ -1,7 +1,7 @@
 # Standa 8MTF control module, not all original API features supported.
 
 from ctypes import *
-import urllib.parse
+import urllib.parse, time
 
 # Container for the transformation coefficient between steps and *meters
 class CustomUnits(LittleEndianStructure):
@@ -37,6 +37,28 @@ class MoveSettings(Structure):
 		("uAntiplaySpeed", c_uint),
 		("MoveFlags", c_uint)]
 
+# Status readout data container, status_t
+class Status(Structure):
+	_fields_ = [
+		("MoveSts", c_uint),
+		("MvCmdSts", c_uint),
+		("PWRSts", c_uint),
+		("EncSts", c_uint),
+		("WindSts", c_uint),
+		("CurPosition", c_int),
+		("uCurPosition", c_int),
+		("EncPosition", c_longlong),
+		("CurSpeed", c_int),
+		("uCurSpeed", c_int),
+		("Ipwr", c_int),
+		("Upwr", c_int),
+		("Iusb", c_int),
+		("Uusb", c_int),
+		("CurT", c_int),
+		("Flags", c_uint),
+		("GPIOFlags", c_uint),
+		("CmdBufFreeSpace", c_uint)]
+
 # Position readout data container
 class Position(Structure):
 	_fields_ = [
@@ -44,7 +66,11 @@ class Position(Structure):
 		("EncPosition", c_longlong)]
 
 SO_FILENAME = "libximc.so.7"
-API = CDLL("/usr/lib/" + SO_FILENAME)
+# Missing library is only a problem if we actually try to use the stage
+try:
+    API = CDLL("/usr/lib/" + SO_FILENAME)
+except OSError:
+    API = None
 
 # Absolute maximum speed in steps/min
 MAX_STEP_SPEED = 2000
@@ -53,6 +79,12 @@ USTEP_MODE_256 = 0x09
 # Time to wait between subsequent polls to the controller to check if
 # axes have reached their position and motors have stopped
 STOP_POLL_INTERVAL = 100
+# Give up waiting for a move after this long, s
+MOVE_TIMEOUT = 900
+# Status_t.MvCmdSts bit set until the last motion command is done, antiplay
+# included. Same test as libximc's command_wait_for_stop(): MoveSts can read
+# 0 right after command_move and between the move and the antiplay.
+MVCMD_RUNNING = 0x80
 # Multiplicative coefficient to convert between steps and micrometers
 # =======================> AT 1/256 MICROSTEPPING MODE <=======================
 # NOTE: THIS VALUE WILL BE DIFFERENT AT OTHER MODES!
@@ -74,6 +106,8 @@ class Axis():
         self.axis = API.open_device(name)
         # Keep track of the original stage class
         self.stage = stage
+        # Reused by every isMoving() call
+        self.status = Status()
 
         self.connected = True
 
@@ -88,7 +122,16 @@ class Axis():
             byref(self.stage.units)))
 
         if wait:
-            check(API.command_wait_for_stop(self.axis, STOP_POLL_INTERVAL))
+            self.wait()
+
+    # Block until the motor has stopped
+    def wait(self):
+        check(API.command_wait_for_stop(self.axis, STOP_POLL_INTERVAL))
+
+    # Check, without blocking, whether the motor is still moving
+    def isMoving(self):
+        check(API.get_status(self.axis, byref(self.status)))
+        return self.status.MvCmdSts & MVCMD_RUNNING != 0
 
     # Zero this axis, this sets the current position as the origin
     def setZero(self):
@@ -132,13 +175,21 @@ class Axis():
 
 class Stage():
 
-    # Connect to each axis
-    def __init__(self, axes, units = None):
+    # Connect to each axis. While waiting for moves to end, axes are polled
+    # every _interval_ ms for up to _timeout_ s.
+    def __init__(self, axes, units = None, interval = STOP_POLL_INTERVAL,
+        timeout = MOVE_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        if API == None:
+            self.connected = False
+            return
+
         self.devices = API.enumerate_devices(0x01, b"addr=")
         self.connected = True
 
         self.axes = {}
-        for k, axis in axes:
+        for k, axis in axes.items():
             self.axes[k] = Axis(self, axis)
             self.connected &= self.axes[k].connected
 
@@ -176,27 +227,47 @@ class Stage():
     # if powered down completely, thus the origin will remain set until
     # changed externally.
     # If _wait_ is set to True the function will wait for all motors to stop
-    # before returning.
+    # before returning, otherwise use wait() later on.
+    # All axes are sent off before waiting on any, so they move together and
+    # a diagonal move takes as long as the longest axis, not their sum.
     def to(self, coords, wait = True):
-        for k, coord in coords:
-            self.axes[k].to(coord, wait)
+        for k, coord in coords.items():
+            self.axes[k].to(coord, False)
+
+        if wait:
+            self.wait()
 
     def to2d(self, x, y, wait = True):
         coords = {"x": x, "y": y}
         self.to(coords, wait)
 
+    # Block until all motors have stopped, polling them all together.
+    # Returns False if they are still moving after the timeout.
+    def wait(self):
+        deadline = time.monotonic() + self.timeout
+        moving = list(self.axes.values())
+        while True:
+            moving = [axis for axis in moving if axis.isMoving()]
+            if len(moving) == 0:
+                return True
+            if time.monotonic() > deadline:
+                print("\nStage: still moving after {} s, giving up".format(
+                    self.timeout))
+                return False
+            time.sleep(self.interval / 1E3)
+
     # Get the current position relative to the origin
     def getPosition(self):
-        return [axis.getPosition() for axis in self.axes]
+        return [axis.getPosition() for k, axis in self.axes.items()]
 
     # Set the speed in steps/min for all axes
     def setSpeed(self, value):
-        for axis in self.axes:
+        for k, axis in self.axes.items():
             axis.setSpeed(value)
 
     # Close the connection to all axes
     def close(self):
-        for axis in self.axes:
+        for k, axis in self.axes.items():
             axis.close()
         self.connected = False
 
@@ -0,0 +1,178 @@
+# Decoding of raw X742 block transfers with NumPy, without going through
+# libCAENDigitizer (and thus without an open connection to the board).
+# Mirrors what CAEN_DGTZ_GetEventInfo and CAEN_DGTZ_DecodeEvent do, except
+# for the DRS4 corrections: samples come out as raw ADC counts.
+
+import numpy as np
+from .digitizer import INFO_DTYPE, GROUP_DTYPE, GROUPS, GROUP_CHANNELS
+
+# Words in the event header, the first one carries this tag in its top nibble
+HEADER_WORDS = 4
+HEADER_TAG = 0xA
+
+# Number of words needed to pack 8 samples at 12 bit
+PACK_WORDS = 3
+
+# Walk the event headers in _data_ and return the size in bytes taken by
+# the first _count_ events (or all of them) and how many they are
+def truncate(data, count = None):
+    words = np.frombuffer(data, np.uint32)
+    offset, events = 0, 0
+    while offset < len(words) and (count == None or events < count):
+        if words[offset] >> 28 != HEADER_TAG:
+            break
+        offset += int(words[offset] & 0x0FFFFFFF)
+        events += 1
+
+    return min(offset, len(words)) * 4, events
+
+# Read the headers of the first _count_ events (or all of them) in _data_,
+# without decoding samples. Returns one INFO_DTYPE record per event.
+def headers(data, count = None):
+    words = np.frombuffer(data, np.uint32)
+    size, events = truncate(data, count)
+
+    info = np.zeros(events, INFO_DTYPE)
+    offset = 0
+    for i in range(events):
+        header = words[offset:offset + HEADER_WORDS]
+        info[i] = (int(header[0] & 0x0FFFFFFF) * 4,
+            int(header[1] >> 27),
+            int((header[1] >> 8) & 0xFFFF),
+            int(header[1] & 0xF),
+            int(header[2] & 0xFFFFFF),
+            int(header[3]))
+        offset += int(header[0] & 0x0FFFFFFF)
+
+    return info
+
+# Unpack a run of little-endian 12 bit values, as found in the DRS4 data
+def unpack(words):
+    data = words.view(np.uint8).reshape(-1, 3).astype(np.uint16)
+    samples = np.empty((len(data), 2), np.uint16)
+    samples[:, 0] = data[:, 0] | ((data[:, 1] & 0xF) << 8)
+    samples[:, 1] = (data[:, 1] >> 4) | (data[:, 2] << 4)
+    return samples.reshape(-1)
+
+# Inverse of unpack(): pack pairs of 12 bit values along the last axis
+def pack(samples):
+    values = samples.astype(np.uint32).reshape(samples.shape[:-1] + (-1, 2))
+    data = np.empty(values.shape[:-1] + (3,), np.uint8)
+    data[..., 0] = values[..., 0] & 0xFF
+    data[..., 1] = ((values[..., 0] >> 8) & 0xF) | ((values[..., 1] & 0xF) << 4)
+    data[..., 2] = (values[..., 1] >> 4) & 0xFF
+    return data.reshape(samples.shape[:-1] + (-1,)).view(np.uint32)
+
+# Size in words of one group of _length_ samples per channel
+def groupWords(length, digitized = True):
+    size = length * PACK_WORDS
+    return 2 + size + (size // 8 if digitized else 0)
+
+# Build a block transfer out of _samples_ (12 bit ADC counts) with shape
+# (events, GROUPS * GROUP_CHANNELS, length), the inverse of decode().
+# Groups not in _mask_ are left out, as are TR0 rows unless _digitized_.
+# _counters_, _timeTags_ are per event, _cells_ and _lags_ per event and
+# group. Returns the block as bytes.
+def encode(samples, counters, timeTags, cells, lags, mask = 0b11,
+    digitized = True, board = 0):
+    events, rows, length = samples.shape
+    present = [g for g in range(GROUPS) if (mask >> g) & 1]
+    size = length * PACK_WORDS
+    words = HEADER_WORDS + len(present) * groupWords(length, digitized)
+    block = np.zeros((events, words), np.uint32)
+
+    block[:, 0] = (HEADER_TAG << 28) | words
+    block[:, 1] = (board << 27) | mask
+    block[:, 2] = np.asarray(counters) & 0xFFFFFF
+    block[:, 3] = np.asarray(timeTags) & 0xFFFFFFFF
+
+    position = HEADER_WORDS
+    for g in present:
+        first = g * GROUP_CHANNELS
+        block[:, position] = (size | (digitized << 12) |
+            ((np.asarray(cells)[:, g].astype(np.uint32) & 0x3FF) << 20))
+        position += 1
+
+        # Channels are interleaved sample by sample
+        channels = samples[:, first:first + 8].transpose(0, 2, 1)
+        block[:, position:position + size] = \
+            pack(channels.reshape(events, -1))
+        position += size
+
+        if digitized:
+            block[:, position:position + size // 8] = \
+                pack(samples[:, first + 8])
+            position += size // 8
+
+        block[:, position] = np.asarray(lags)[:, g] & 0x3FFFFFFF
+        position += 1
+
+    return block.tobytes()
+
+# Decode every event in _data_ (bytes-like, the content of a readout buffer).
+# Returns the same (samples, info, groups) triplet as Digitizer.decodeBlock()
+# but in freshly allocated arrays.
+def decode(data, count = None):
+    words = np.frombuffer(data, np.uint32)
+    size, events = truncate(data, count)
+
+    # All events in a run share the same record length, find it from the
+    # first group we come across
+    length = 0
+    if events > 0:
+        length = int(words[HEADER_WORDS] & 0xFFF) // PACK_WORDS
+
+    samples = np.zeros((events, GROUPS * GROUP_CHANNELS, length), np.float32)
+    info = headers(data, events)
+    groups = np.zeros((events, GROUPS), GROUP_DTYPE)
+
+    offset = 0
+    for i in range(events):
+        header = words[offset:offset + HEADER_WORDS]
+        position = offset + HEADER_WORDS
+        for g in range(GROUPS):
+            if not (header[1] >> g) & 1:
+                continue
+            position = decodeGroup(words, position, samples[i], groups[i, g],
+                g)
+
+        offset += int(header[0] & 0x0FFFFFFF)
+
+    return samples, info, groups
+
+# Decode one group starting at word _position_ into the rows of _event_
+# belonging to group _g_. Returns the position of the next group.
+def decodeGroup(words, position, event, stats, g):
+    header = int(words[position])
+    size = header & 0xFFF
+    digitized = (header >> 12) & 1
+    length = size // PACK_WORDS
+    position += 1
+
+    stats["GrPresent"] = 1
+    stats["StartIndexCell"] = (header >> 20) & 0x3FF
+
+    # Channel data: for every sample, 8 channels packed in 3 words
+    first = g * GROUP_CHANNELS
+    channels = unpack(words[position:position + size])
+    event[first:first + 8, :length] = \
+        channels.reshape(length, 8).T[:, :event.shape[1]]
+    stats["ChSize"][:8] = length
+    position += size
+
+    # Digitized TR0: 8 consecutive samples in 3 words
+    if digitized:
+        trigger = unpack(words[position:position + size // 8])
+        event[first + 8, :length] = trigger[:event.shape[1]]
+        stats["ChSize"][8] = length
+        position += size // 8
+
+    # Group trailer, holds the trigger time lag
+    stats["TriggerTimeLag"] = int(words[position]) & 0x3FFFFFFF
+    return position + 1
+
+if __name__ == "__main__":
+    print("I'm a module, please don't run me alone.")
+    exit()
+else:
+    print("[X742 ok] ", end = "")
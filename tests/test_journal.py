@@ -0,0 +1,26 @@
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    ".."))
+from modules.io import journal
+
+# A point topped up from 20 to 60 events: the merit is that of all 60
+def test_topUpCombinesMerit(tmp_path):
+    log = journal.Journal(str(tmp_path), "run")
+    log.add(100, 0, 10, 20, [10.0, 40.0])
+    log.add(100, 0, 10, 40, [40.0, 40.0])
+    assert log.taken(100, 0, 10) == 60
+    assert log.merit(100, 0, 10) == [30.0, 40.0]
+    log.close()
+
+    resumed = journal.Journal(str(tmp_path), "run", resume = True)
+    assert resumed.taken(100, 0, 10) == 60
+    assert resumed.merit(100, 0, 10) == [30.0, 40.0]
+    resumed.close()
+
+# Points without a merit before keep the new one as is
+def test_firstMerit(tmp_path):
+    log = journal.Journal(str(tmp_path), "run")
+    log.add(100, 0, 0, 20)
+    log.add(100, 0, 0, 20, [5.0])
+    assert log.merit(100, 0, 0) == [5.0]
+    log.close()